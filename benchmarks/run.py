@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the hot paths in hydro.
+
+    python -m benchmarks.run                        # default sizes, compare to baseline
+    python -m benchmarks.run --sizes 1e3 1e6 1e8 --cases dailyQ IDW
+    python -m benchmarks.run --save                 # write a new baseline
+
+Each case runs on seeded synthetic data from benchmarks.synthetic and reports
+throughput (samples per second) and peak memory (tracemalloc). The cost of
+`import hydro` in a fresh interpreter is reported first; it fails if the import
+pulls in matplotlib. Results are
+compared to a stored baseline: a result digest that no longer matches is a
+correctness regression, a run more than --slowdown times slower than the
+baseline is a performance regression. Either makes the exit status non-zero.
+"""
+import argparse, json, os, subprocess, sys, time, tracemalloc
+import numpy as np
+import hydro
+from . import synthetic
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def _discharge(n):
+    time_, Q, stage, rain = synthetic.storm_hydrograph(n)
+    return time_, Q, rain
+
+# name: (setup(n) -> state, run(state) -> result)
+CASES = {
+    'RC': (lambda n: synthetic.rating_measurements(n),
+           lambda m: hydro.RC(*m).popt),
+    'RC.Q': (lambda n: (hydro.RC(*synthetic.rating_measurements(30)), synthetic.storm_hydrograph(n)[2]),
+             lambda s: s[0].Q(s[1])),
+    'RC.bands': (lambda n: (hydro.RC(*synthetic.rating_measurements(30)), synthetic.storm_hydrograph(n)[2]),
+                 lambda s: s[0].bands(s[1], n_samples=200, method='bootstrap', seed=0).values[:, 1:]),
+    # a fresh Discharge per run so cached aggregates are not reused
+    'dailyQ': (_discharge, lambda d: hydro.Discharge(*d).dailyQ().meanQ.values),
+    'RB_Flashiness': (_discharge, lambda d: hydro.Discharge(*d).RB_Flashiness()),
+    'flow_duration': (_discharge, lambda d: hydro.Discharge(*d).flow_duration().values),
+    'events': (_discharge, lambda d: hydro.Discharge(*d).events().arrays['peak_Q']),
+    'Lyne_Hollick': (lambda n: synthetic.storm_hydrograph(n)[1],
+                     lambda Q: hydro.Discharge(None, Q).Lyne_Hollick(direction='frf')),
+    'Eckhardt': (lambda n: synthetic.storm_hydrograph(n)[1],
+                 lambda Q: hydro.Discharge(None, Q).Eckhardt(re=3)),
+    'calibrate_baseflow': (lambda n: synthetic.storm_hydrograph(n)[1],
+                           lambda Q: hydro.calibrate_baseflow(Q, hydro.eckhardt(Q, .97, .7), 'Eckhardt',
+                                                              np.linspace(.9, .99, 10),
+                                                              np.linspace(.5, .9, 5))[1].score.values),
+    'sinuosity': (lambda n: synthetic.meandering_centerline(n),
+                  lambda c: hydro.sinuosity(c[0], c[1], 500, 4)),
+    'Profile_smoothing': (lambda n: synthetic.meandering_centerline(n)[3],
+                          lambda e: hydro.Profile_smoothing(e)),
+    'IDW': (lambda n: synthetic.gauge_field(n),
+            lambda g: hydro.IDW(*g, power=2, k=12)),
+}
+
+def digest(result):
+    """Small summary of a result used to detect changed output."""
+    values = np.asarray(result, dtype=float).ravel()
+    finite = values[np.isfinite(values)]
+    return [len(values), float(finite.sum()) if len(finite) else 0.0]
+
+def measure(name, n, repeat=3):
+    setup, run = CASES[name]
+    state = setup(n)
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run(state)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': best, 'throughput': n / best, 'peak_mb': peak / 2**20,
+            'digest': digest(result)}
+
+def import_cost():
+    """
+    Time to import hydro in a fresh interpreter, from python -X importtime, and
+    which heavy optional modules the import loaded.
+    """
+    code = "import sys, hydro; print(' '.join(m for m in ('matplotlib', 'scipy') if m in sys.modules))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=root,
+                          capture_output=True, text=True, check=True)
+    total = own = 0
+    for line in proc.stderr.splitlines():
+        parts = [p.strip() for p in line.split('|')]
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        if parts[2] == 'hydro':
+            total = int(parts[1])
+        if parts[2].startswith('hydro'):
+            own += int(parts[0].split(':')[-1])
+    return {'seconds': total / 1e6, 'own_seconds': own / 1e6, 'loaded': proc.stdout.split()}
+
+def compare(record, base, slowdown):
+    """Returns a list of regressions of record against its baseline entry."""
+    problems = []
+    if not np.allclose(record['digest'], base['digest'], rtol=1e-6, atol=1e-9):
+        problems.append(f"result changed: {base['digest']} -> {record['digest']}")
+    # runs shorter than a millisecond are too noisy to compare
+    if base['seconds'] >= 1e-3 and record['seconds'] > slowdown * base['seconds']:
+        problems.append(f"{record['seconds'] / base['seconds']:.1f}x slower")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e3, 1e4, 1e5])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--slowdown', type=float, default=1.5,
+                        help='allowed slowdown against the baseline before failing')
+    parser.add_argument('--save', action='store_true', help='write results as the new baseline')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    cost = import_cost()
+    base = baseline.get('import')
+    status = 'ok' if not cost['loaded'] else 'loaded ' + ', '.join(cost['loaded'])
+    if base is not None and cost['seconds'] > args.slowdown * base['seconds']:
+        status = f"{cost['seconds'] / base['seconds']:.1f}x slower"
+    failed = status != 'ok'
+    print(f"import hydro: {cost['seconds'] * 1e3:.0f} ms, {cost['own_seconds'] * 1e3:.0f} ms in hydro "
+          f"modules  {status}\n")
+
+    results = {'import': cost}
+    print(f"{'case':<18}{'n':>12}{'seconds':>11}{'samples/s':>13}{'peak MB':>10}  status")
+    for name in args.cases:
+        for n in (int(s) for s in args.sizes):
+            record = measure(name, n, args.repeat)
+            results.setdefault(name, {})[str(n)] = record
+            base = baseline.get(name, {}).get(str(n))
+            status = 'new' if base is None else '; '.join(compare(record, base, args.slowdown)) or 'ok'
+            failed |= status not in ('ok', 'new')
+            print(f"{name:<18}{n:>12}{record['seconds']:>11.4f}{record['throughput']:>13.3g}"
+                  f"{record['peak_mb']:>10.1f}  {status}")
+
+    if args.save:
+        baseline['import'] = results.pop('import')
+        for name, sizes in results.items():
+            baseline.setdefault(name, {}).update(sizes)
+        with open(args.baseline, 'w') as fh:
+            json.dump(baseline, fh, indent=1, sort_keys=True)
+    return 1 if failed and not args.save else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
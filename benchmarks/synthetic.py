@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Seeded synthetic data for the benchmarks: hydrographs, stream centerlines and gauge fields."""
+import numpy as np
+from scipy.signal import lfilter
+
+def storm_hydrograph(n, seed=0, step='15min', storms_per_day=.05):
+    """
+    15-minute discharge record with seasonal baseflow and storm runoff.
+
+    Storms arrive as a Poisson process with random peaks; each recedes
+    exponentially. Returns time (datetime64[ns]), discharge, stage and rain arrays.
+    """
+    rng = np.random.default_rng(seed)
+    dt = np.timedelta64(15, 'm') if step == '15min' else np.timedelta64(step)
+    time = np.datetime64('2000-01-01T00:00', 'ns') + np.arange(n) * dt
+    per_day = np.timedelta64(1, 'D') / dt
+    days = np.arange(n) / per_day
+    base = 2 + 1.5 * np.sin(2 * np.pi * days / 365.25) + rng.normal(0, .02, n)
+
+    storms = rng.random(n) < storms_per_day / per_day
+    rain = np.where(storms, rng.gamma(2, .4, n), 0.0)
+    # quickflow rises with rain and recedes with a half-life of about six hours
+    k = .5 ** (1 / (per_day / 4))
+    quick = lfilter([1 - k], [1, -k], rain * rng.uniform(50, 400, n))
+    Q = np.maximum(base + quick, .01)
+    stage = (Q / .7) ** (1 / 4.8)
+    return time, Q, stage, rain
+
+def rating_measurements(n, seed=0):
+    """Stage-discharge field measurements scattered around Q = 0.7 * stage**4.8."""
+    rng = np.random.default_rng(seed)
+    stage = rng.uniform(.8, 2.5, n)
+    discharge = .7 * stage**4.8 * rng.lognormal(0, .08, n)
+    return stage, discharge
+
+def meandering_centerline(n, seed=0, spacing=4.0, wavelength=400.0, amplitude=1.2):
+    """
+    Sine-generated meandering channel with points every 'spacing' feet, and a
+    falling elevation profile with road-crossing bumps.
+
+    Returns Easting, Northing, chainage and elevation arrays.
+    """
+    rng = np.random.default_rng(seed)
+    s = np.arange(n) * spacing
+    theta = amplitude * np.sin(2 * np.pi * s / wavelength) + np.cumsum(rng.normal(0, .01, n))
+    east = 668750 + np.cumsum(np.cos(theta)) * spacing
+    north = 1263266 + np.cumsum(np.sin(theta)) * spacing
+    elevation = 460 - s * .002 + rng.normal(0, .05, n)
+    for start in rng.integers(0, n, max(n // 2000, 1)):
+        elevation[start:start + rng.integers(5, 60)] += rng.uniform(1, 8)
+    return east, north, s, elevation
+
+def gauge_field(n_grid, n_gauges=200, seed=0, size=1e5):
+    """
+    Rain gauges scattered over a square area and a grid of about n_grid cells.
+
+    Returns gauge x, y, z and grid xi, yi arrays.
+    """
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(0, size, n_gauges), rng.uniform(0, size, n_gauges)
+    z = rng.gamma(2, .5, n_gauges)
+    side = max(int(np.sqrt(n_grid)), 1)
+    xi, yi = np.meshgrid(np.linspace(0, size, side), np.linspace(0, size, side))
+    return x, y, z, xi, yi
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import pandas as pd, numpy as np, pyproj, matplotlib.pyplot as plt
+import pandas as pd, numpy as np, matplotlib.pyplot as plt
 import hydro 
 
 # calculate rating curve for give flows
@@ -60,15 +60,9 @@ data = pd.read_csv("stream.csv")
 adjusted_elevation = hydro.Profile_smoothing(data.ELEVATION, data.DISTANCE_FROM_MOUTH,
                                              plot=True)
 
-# Reproject coordinates
-NAD83_GAfeet = pyproj.Proj("+init=EPSG:2239")
-def trans(lon, lat):
-    lon2, lat2 = NAD83_GAfeet(lon, lat, preserve_units=True)
-    return (lon2/0.3048006096012192, lat2/0.3048006096012192)
-data['Easting'] = np.zeros(len(data))
-data['Northing'] = np.zeros(len(data))
-for i in range(len(data)):
-    data.Easting.values[i], data.Northing.values[i] = trans(data.LONGITUDE.iloc[i], data.LATITUDE.iloc[i])
+# Reproject coordinates to NAD83 / Georgia East in US survey feet
+data['Easting'], data['Northing'] = hydro.reproject(data.LONGITUDE, data.LATITUDE,
+                                                    'EPSG:2239', units='us-ft')
 
 # Calculate sinuosity 1000 ft on either side of points that are 4 ft apart
 sin = hydro.sinuosity(data.Easting, data.Northing, 500, 4)
@@ -1,2 +1,10 @@
 from .core import *
 from .geography import *
+from .baseflow import *
+from .loggers import *
+from .resample import *
+from .sketch import *
+from .events import *
+from .hydraulics import *
+from .cache import *
+from .batch import *
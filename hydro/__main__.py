@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line entry point.
+
+    python -m hydro batch LOGGER_DIR OUT_DIR --rating ratings.csv --processes 8
+
+Runs stage to discharge, dailyQ, RB_Flashiness, flow_duration and baseflow
+separation for every logger csv in LOGGER_DIR and writes one directory of
+columnar tables per gauge to OUT_DIR, plus a summary table. Finished gauges are
+checkpointed, so rerunning an interrupted batch only processes the rest.
+"""
+import argparse, sys
+from .batch import run_batch, FORMATS
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m hydro', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    batch = commands.add_parser('batch', help='process a directory of logger csv files')
+    batch.add_argument('logger_dir')
+    batch.add_argument('out_dir')
+    batch.add_argument('--rating', help='csv of site, stage, discharge measurements; '
+                       'omit if the loggers record discharge')
+    batch.add_argument('--processes', type=int, help='worker processes (default one per CPU)')
+    batch.add_argument('--format', choices=FORMATS, default='npz')
+    batch.add_argument('--stage', default='Level_ft', help='stage (or discharge) column')
+    batch.add_argument('--rain', default='Rainfall_in', help="rain column, or '' for none")
+    batch.add_argument('--time-col', default='TimeStamp')
+    batch.add_argument('--cache-dir', help='logger cache directory, one subdirectory per site '
+                       '(default OUT_DIR/.logger_cache)')
+    batch.add_argument('--baseflow', nargs='+', choices=['Lyne_Hollick', 'Eckhardt'],
+                       default=['Lyne_Hollick', 'Eckhardt'])
+    batch.add_argument('--alpha', type=float, default=.925, help='Lyne_Hollick filter parameter')
+    batch.add_argument('--direction', default='f', help='Lyne_Hollick passes, e.g. frf')
+    batch.add_argument('--alpha-eckhardt', type=float, default=.98)
+    batch.add_argument('--BFI', type=float, default=.80, help='Eckhardt BFI_max')
+    batch.add_argument('--re', type=int, default=1, help='Eckhardt passes')
+    batch.add_argument('--skip-errors', action='store_true',
+                       help='warn about gauges that fail instead of stopping')
+    batch.add_argument('--no-resume', action='store_true', help='redo finished gauges')
+    args = parser.parse_args(argv)
+
+    options = {k: getattr(args, k) for k in ('format', 'stage', 'time_col', 'baseflow', 'alpha',
+                                             'direction', 'alpha_eckhardt', 'BFI', 're')}
+    options['rain'] = args.rain or None
+    if args.cache_dir:
+        options['cache_dir'] = args.cache_dir
+    summary = run_batch(args.logger_dir, args.out_dir, args.rating, args.processes,
+                        'skip' if args.skip_errors else 'raise', not args.no_resume, **options)
+    print(summary.to_string(index=False) if len(summary) else 'no gauges processed')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
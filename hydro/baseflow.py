@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np, pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+__all__ = ['clamped_recursion', 'lyne_hollick', 'eckhardt', 'OBJECTIVES', 'calibrate_baseflow',
+           'BaseflowStream']
+
+_BLOCK = 64
+
+def _compose_scan(p, q, r):
+    """
+    In-place inclusive prefix scan along axis 1 of maps x -> max(p*x + q, r).
+    Composing two such maps gives (p1*p2, p2*q1 + q2, max(p2*r1 + q2, r2)).
+    """
+    n = p.shape[1]
+    k = 1
+    while k < n:
+        p2, q2, r2 = p[:, k:], q[:, k:], r[:, k:]
+        q_new = p2 * q[:, :-k]
+        q_new += q2
+        r_new = p2 * r[:, :-k]
+        r_new += q2
+        np.maximum(r_new, r2, out=r_new)
+        p2 *= p[:, :-k].copy()
+        q2[...] = q_new
+        r2[...] = r_new
+        k *= 2
+
+def clamped_recursion(u, a, out=None, x0=0):
+    """
+    Evaluates the clamped first-order recurrence
+
+        x[0] = x0
+        x[t] = max(0, a * x[t-1] + u[t])
+
+    along the first axis of u without a Python level loop. Each step is the
+    map x -> max(a*x + u, 0); maps of that form compose into another map of
+    the same form, so the series is solved as a prefix scan, first inside
+    fixed size blocks and then across the block boundaries.
+
+    u: array of forcing terms, time along the first axis (u[0] is ignored)\n
+    a: filter coefficient, a scalar or an array broadcastable to u.shape[1:]\n
+    out: optional array to write the result into\n
+    x0: non-negative starting value, a scalar or an array like a
+    """
+    u = np.asarray(u)
+    if u.dtype.kind != 'f':
+        u = u.astype(float)
+    n = len(u)
+    if out is None:
+        out = np.empty_like(u)
+    if n == 0:
+        return out
+
+    # pad to whole blocks; padded steps come after the data and are discarded
+    nb = -(-n // _BLOCK)
+    shape = (nb, _BLOCK) + u.shape[1:]
+    q = np.zeros(shape, dtype=u.dtype)
+    q.reshape((nb * _BLOCK,) + u.shape[1:])[1:n] = u[1:]
+    p = np.empty(shape, dtype=u.dtype); p[...] = a
+    p[0, 0] = 0     # the first step maps everything to x[0] = x0
+    q[0, 0] = x0
+    r = np.zeros(shape, dtype=u.dtype)
+    _compose_scan(p, q, r)
+
+    # scan the block totals, then carry each block's end value into the next
+    P, Qb, R = (x[np.newaxis, :, -1].copy() for x in (p, q, r))
+    _compose_scan(P, Qb, R)
+    start = np.zeros((nb,) + u.shape[1:], dtype=u.dtype)
+    np.maximum(Qb[0, :-1], R[0, :-1], out=start[1:])
+
+    start = start[:, np.newaxis]
+    p *= start
+    p += q
+    np.maximum(p, r, out=p)
+    out[...] = p.reshape((nb * _BLOCK,) + u.shape[1:])[:n]
+    return out
+
+def _output(Q, out):
+    """Copies Q into out (or a new float array) for the filters to work on in place."""
+    if out is None:
+        Q = np.asarray(Q)
+        return np.array(Q, dtype=Q.dtype if Q.dtype.kind == 'f' else float)
+    if out is not Q:
+        out[...] = Q
+    return out
+
+def lyne_hollick(Q, alpha=.925, direction='f', out=None):
+    """
+    Recursive digital filter for baseflow separation. Based on Lyne and Hollick, 1979.
+
+    Q : array of discharge measurements, time along the first axis\n
+    alpha : filter parameter\n
+    direction : (f)orward or (r)everse calculation, one character per pass\n
+    out : optional float array to write the baseflow into; may be Q itself
+
+    Returns the baseflow after the last pass.
+    """
+    bflow = _output(Q, out)
+    n = len(bflow)
+    c = (1 + alpha) / 2
+    u = np.empty_like(bflow)
+    f = np.empty_like(bflow)
+    for d in direction:
+        if d == 'f':
+            b, uu, ff = bflow, u, f
+        elif d == 'r':
+            # the reverse pass leaves the last point and the first two untouched
+            m = max(n - 2, 0)
+            b, uu, ff = bflow[::-1][:m], u[:m], f[:m]
+        else:
+            continue
+        if len(b) == 0:
+            continue
+        np.subtract(b[1:], b[:-1], out=uu[1:])
+        uu[1:] *= c
+        clamped_recursion(uu, alpha, out=ff)
+        b -= ff
+    return bflow
+
+def eckhardt(Q, alpha=.98, BFI=.80, re=1, out=None):
+    """
+    Recursive digital filter for baseflow separation. Based on Eckhardt, 2004.
+
+    Q : array of discharge measurements, time along the first axis\n
+    alpha : filter parameter\n
+    BFI : BFI_max (maximum baseflow index)\n
+    re : number of times to run filter\n
+    out : optional float array to write the baseflow into; may be Q itself
+
+    Returns the baseflow after the last pass.
+    """
+    bflow = _output(Q, out)
+    A = (1 - BFI) * alpha / (1 - alpha * BFI)
+    B = (1 - alpha) * BFI / (1 - alpha * BFI)
+    u = np.empty_like(bflow)
+    d = np.empty_like(bflow)
+    for _ in range(max(re, 1)):
+        if len(bflow) == 0:
+            break
+        # solved for the quickflow d = Q - f, which is clamped at zero
+        np.multiply(bflow[1:], 1 - B, out=u[1:])
+        u[1:] -= A * bflow[:-1]
+        clamped_recursion(u, A, out=d)
+        bflow -= d
+    return bflow
+
+def _nse(sim, obs):
+    """Nash-Sutcliffe efficiency of each column of sim."""
+    return 1 - np.sum((sim - obs[:, np.newaxis])**2, axis=0) / np.sum((obs - obs.mean())**2)
+
+def _kge(sim, obs):
+    """Kling-Gupta efficiency of each column of sim."""
+    r = np.array([np.corrcoef(col, obs)[0, 1] for col in sim.T]) if len(obs) > 1 else np.nan
+    return 1 - np.sqrt((r - 1)**2 + (sim.std(axis=0) / obs.std() - 1)**2
+                       + (sim.mean(axis=0) / obs.mean() - 1)**2)
+
+# name: (score function(sim, obs) of each column, True if higher is better)
+OBJECTIVES = {
+    'nse': (_nse, True),
+    'kge': (_kge, True),
+    'rmse': (lambda sim, obs: np.sqrt(np.mean((sim - obs[:, np.newaxis])**2, axis=0)), False),
+    'mae': (lambda sim, obs: np.mean(np.abs(sim - obs[:, np.newaxis]), axis=0), False),
+}
+
+def _sweep(method, Q, reference, alpha, BFI, direction, re, objective):
+    """Scores one block of parameter sets, one per column."""
+    score = OBJECTIVES[objective][0] if isinstance(objective, str) else objective
+    Q = np.broadcast_to(np.asarray(Q, dtype=float)[:, np.newaxis], (len(Q), len(alpha)))
+    if method == 'Lyne_Hollick':
+        bflow = lyne_hollick(Q, alpha, direction, out=np.empty(Q.shape))
+    else:
+        bflow = eckhardt(Q, alpha, BFI, re, out=np.empty(Q.shape))
+    known = ~np.isnan(reference)
+    return score(bflow[known], reference[known])
+
+def calibrate_baseflow(Q, reference, method='Lyne_Hollick', alpha=None, BFI=None,
+                       direction='f', re=1, objective='nse', max_bytes=2**28, processes=None):
+    """
+    Scores a grid of filter parameters against a reference baseflow series (e.g.
+    from tracers) and returns the best set. All parameter sets in a block are
+    filtered at once, as extra columns of one array, so the series is not
+    re-filtered one parameter set at a time.
+
+    Q : discharge series\n
+    reference : reference baseflow at the same times; NaN where unknown\n
+    method : 'Lyne_Hollick' or 'Eckhardt'\n
+    alpha : values of the filter parameter to try\n
+    BFI : values of BFI_max to try (Eckhardt only); every alpha is paired with every BFI\n
+    direction, re : passes, as in lyne_hollick and eckhardt\n
+    objective : 'nse', 'kge', 'rmse', 'mae', or a function(sim, obs) returning a
+    score per column of sim where higher is better\n
+    max_bytes : rough memory budget per block of parameter sets\n
+    processes : spread blocks over this many worker processes (None runs in this process)
+
+    Returns a dictionary of the best parameters and score, and a dataframe of the
+    score of every parameter set.
+    """
+    if method not in ('Lyne_Hollick', 'Eckhardt'):
+        raise ValueError("method must be 'Lyne_Hollick' or 'Eckhardt'")
+    if alpha is None:
+        alpha = np.linspace(.9, .995, 20) if method == 'Lyne_Hollick' else np.linspace(.95, .995, 10)
+    if BFI is None:
+        BFI = [.8] if method == 'Eckhardt' else [np.nan]
+    grid = pd.DataFrame([(a, b) for a in np.ravel(alpha) for b in np.ravel(BFI)],
+                        columns=['alpha', 'BFI'])
+    Q = np.asarray(Q, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+
+    # about a dozen n x block arrays are alive while filtering a block
+    block = max(int(max_bytes // (12 * 8 * max(len(Q), 1))), 1)
+    starts = range(0, len(grid), block)
+    args = [(method, Q, reference, grid.alpha.values[i:i+block], grid.BFI.values[i:i+block],
+             direction, re, objective) for i in starts]
+    if processes is None:
+        scores = [_sweep(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            scores = list(pool.map(_sweep, *zip(*args)))
+    grid['score'] = np.concatenate(scores)
+    if method == 'Lyne_Hollick':
+        del grid['BFI']
+
+    higher = OBJECTIVES[objective][1] if isinstance(objective, str) else True
+    best = grid.score.idxmax() if higher else grid.score.idxmin()
+    return grid.loc[best].to_dict(), grid
+
+class BaseflowStream(object):
+    def __init__(self, method='Lyne_Hollick', alpha=None, BFI=.80, passes=1):
+        """
+        Forward baseflow filter that is fed new discharge samples as they arrive.
+        Only the filter state is kept, so each update costs O(len(chunk)), and the
+        state can be saved with to_dict and restored with from_dict.
+        Output matches lyne_hollick(Q, alpha, 'f' * passes) or eckhardt(Q, alpha, BFI, passes)
+        run over the whole record, up to floating point rounding.
+
+        method : 'Lyne_Hollick' or 'Eckhardt'\n
+        alpha : filter parameter, defaults to .925 for Lyne_Hollick and .98 for Eckhardt\n
+        BFI : BFI_max (maximum baseflow index), Eckhardt only\n
+        passes : number of forward passes
+        """
+        if method not in ('Lyne_Hollick', 'Eckhardt'):
+            raise ValueError("method must be 'Lyne_Hollick' or 'Eckhardt'")
+        if alpha is None:
+            alpha = .925 if method == 'Lyne_Hollick' else .98
+        self.method = method
+        self.alpha = alpha
+        self.BFI = BFI
+        self.passes = max(int(passes), 1)
+        self.count = 0              # samples seen so far
+        self.last_Q = [None] * self.passes   # last input to each pass
+        self.last_f = [None] * self.passes   # last filter value of each pass
+
+    def update(self, Q):
+        """
+        Runs the filter over new discharge samples (time along the first axis)
+        and returns the baseflow for those samples.
+        """
+        bflow = np.array(Q, dtype=float)
+        if len(bflow) == 0:
+            return bflow
+        if self.method == 'Lyne_Hollick':
+            a = self.alpha
+            c0 = c1 = (1 + self.alpha) / 2
+        else:
+            a = (1 - self.BFI) * self.alpha / (1 - self.alpha * self.BFI)
+            c0 = 1 - (1 - self.alpha) * self.BFI / (1 - self.alpha * self.BFI)
+            c1 = a
+        for k in range(self.passes):
+            # put the last sample of the previous chunk in front of this one
+            if self.count == 0:
+                x, x0 = bflow, 0
+            else:
+                x, x0 = np.concatenate([self.last_Q[k][np.newaxis], bflow]), self.last_f[k]
+            u = np.empty_like(x)
+            np.multiply(x[1:], c0, out=u[1:])
+            u[1:] -= c1 * x[:-1]
+            f = clamped_recursion(u, a, x0=x0)
+            self.last_Q[k] = x[-1].copy()
+            self.last_f[k] = f[-1].copy()
+            bflow -= f[len(f) - len(bflow):]
+        self.count += len(bflow)
+        return bflow
+
+    def to_dict(self):
+        """Filter settings and state as a JSON serializable dictionary."""
+        def tolist(v):
+            return None if v is None else np.asarray(v).tolist()
+        return {'method': self.method, 'alpha': self.alpha, 'BFI': self.BFI,
+                'passes': self.passes, 'count': self.count,
+                'last_Q': [tolist(v) for v in self.last_Q],
+                'last_f': [tolist(v) for v in self.last_f]}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuilds a filter saved with to_dict."""
+        stream = cls(state['method'], state['alpha'], state['BFI'], state['passes'])
+        stream.count = state['count']
+        stream.last_Q = [None if v is None else np.array(v, dtype=float) for v in state['last_Q']]
+        stream.last_f = [None if v is None else np.array(v, dtype=float) for v in state['last_f']]
+        return stream
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os, json, shutil, shelve, hashlib, warnings
+import numpy as np, pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .core import RC, fit_rating_curves, measurement_key
+from .baseflow import lyne_hollick, eckhardt
+from .loggers import load_discharge
+
+__all__ = ['FORMATS', 'read_rating_table', 'write_table', 'process_gauge', 'run_batch']
+
+FORMATS = ('npz', 'parquet')
+
+def read_rating_table(path):
+    """
+    Reads stage-discharge measurements for many sites from a csv with columns
+    site, stage and discharge. Returns a dictionary of site name to (stage, discharge).
+    """
+    table = pd.read_csv(path)
+    missing = {'site', 'stage', 'discharge'} - set(table.columns)
+    if missing:
+        raise ValueError(f'{path} is missing columns {sorted(missing)}')
+    return {str(site): (g.stage.values.astype(float), g.discharge.values.astype(float))
+            for site, g in table.groupby('site', sort=False)}
+
+def write_table(frame, path, fmt='npz'):
+    """
+    Writes a dataframe column by column to path + '.npz' (one array per column,
+    read back with numpy.load) or path + '.parquet' (needs pyarrow or fastparquet).
+    """
+    if fmt == 'parquet':
+        frame.to_parquet(path + '.parquet', index=False)
+    elif fmt == 'npz':
+        columns = {}
+        for col in frame.columns:
+            values = frame[col].to_numpy()
+            # text columns as fixed width strings so they load without pickle
+            columns[col] = values.astype(str) if values.dtype == object else values
+        np.savez(path + '.npz', **columns)
+    else:
+        raise ValueError(f'fmt must be one of {FORMATS}')
+
+def _stamp(path, rating, options):
+    """Identifies one gauge's inputs: the logger file, its measurements and the run options."""
+    st = os.stat(path)
+    h = hashlib.sha1(json.dumps([st.st_size, st.st_mtime_ns, options], sort_keys=True).encode())
+    if rating is not None:
+        h.update(measurement_key(*rating).encode())
+    return h.hexdigest()
+
+def _read_checkpoint(site_dir):
+    try:
+        with open(os.path.join(site_dir, 'checkpoint.json')) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def process_gauge(path, out_dir, rating=None, fit=None, options=None):
+    """
+    Runs one logger file through stage to discharge, dailyQ, RB_Flashiness,
+    flow_duration and baseflow separation, and writes the results to
+    out_dir/<site>/: series (time, Q, rain and one baseflow column per method),
+    daily and flow_duration tables, and checkpoint.json with the summary
+    statistics. The results are written to a temporary directory that is renamed
+    into place, so a gauge is either complete or absent.
+
+    path: logger csv file, the site name is the file name without extension\n
+    out_dir: output directory\n
+    rating: (stage, discharge) measurements for the site, or None if the stage
+    column already holds discharge\n
+    fit: fitted (popt, pcov) for rating, so the curve is not refit\n
+    options: dictionary of run options, see run_batch
+
+    Returns the summary statistics as a dictionary.
+    """
+    options = dict(options or {})
+    site = os.path.splitext(os.path.basename(path))[0]
+    rc = None if rating is None else RC(*rating, *(fit or (None, None)))
+    # logger caches name their files after the columns, so each gauge needs its
+    # own; by default they go under out_dir so the input directory is only read
+    cache_dir = options.get('cache_dir') or os.path.join(out_dir, '.logger_cache')
+    cache_dir = os.path.join(cache_dir, site)
+    d = load_discharge(path, rc, options.get('stage', 'Level_ft'), options.get('rain', 'Rainfall_in'),
+                       cache_dir, options.get('time_col', 'TimeStamp'))
+    fmt = options.get('format', 'npz')
+
+    series = {'time': d.time, 'Q': d.Q}
+    if len(d.rain):
+        series['rain'] = d.rain
+    summary = {'site': site, 'rows': len(d.Q),
+               'start': str(d.time[0]) if len(d.Q) else None,
+               'end': str(d.time[-1]) if len(d.Q) else None,
+               'RB_Flashiness': float(d.RB_Flashiness()) if len(d.Q) else np.nan}
+    for method in options.get('baseflow', ('Lyne_Hollick', 'Eckhardt')):
+        if method == 'Lyne_Hollick':
+            bflow = lyne_hollick(d.Q, options.get('alpha', .925), options.get('direction', 'f'))
+        elif method == 'Eckhardt':
+            bflow = eckhardt(d.Q, options.get('alpha_eckhardt', .98), options.get('BFI', .80),
+                             options.get('re', 1))
+        else:
+            raise ValueError("baseflow methods must be 'Lyne_Hollick' or 'Eckhardt'")
+        series[method] = bflow
+        # baseflow index: share of the total flow that is baseflow
+        summary['BFI_' + method] = float(np.nansum(bflow) / np.nansum(d.Q)) if len(d.Q) else np.nan
+
+    site_dir = os.path.join(out_dir, site)
+    tmp = site_dir + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    write_table(pd.DataFrame(series), os.path.join(tmp, 'series'), fmt)
+    write_table(d.dailyQ(), os.path.join(tmp, 'daily'), fmt)
+    write_table(d.flow_duration(), os.path.join(tmp, 'flow_duration'), fmt)
+    with open(os.path.join(tmp, 'checkpoint.json'), 'w') as fh:
+        json.dump({'stamp': options.get('stamp'), 'summary': summary}, fh)
+    shutil.rmtree(site_dir, ignore_errors=True)
+    os.replace(tmp, site_dir)
+    return summary
+
+def run_batch(logger_dir, out_dir, rating_table=None, processes=None, errors='raise',
+              resume=True, pattern='.csv', **options):
+    """
+    Processes every logger csv in a directory with process_gauge, in a process pool.
+
+    logger_dir: directory of logger csv files, one per site\n
+    out_dir: output directory, one subdirectory per site plus a summary table\n
+    rating_table: csv of site, stage, discharge measurements (see read_rating_table);
+    each logger's stage column is converted with the site's rating curve. None if
+    the loggers already record discharge.\n
+    processes: number of worker processes; None uses one per CPU and 1 runs in this process\n
+    errors: 'raise' to stop on a gauge that fails, 'skip' to warn and go on. Failed
+    gauges have no checkpoint and are retried by the next run.\n
+    resume: skip gauges whose checkpoint matches the current logger file,
+    measurements and options\n
+    pattern: file name ending of logger files\n
+    options: stage, rain, time_col, cache_dir (logger caches, one subdirectory per
+    site; default out_dir/.logger_cache), format ('npz' or 'parquet'),
+    baseflow (methods to run), alpha and direction (Lyne_Hollick),
+    alpha_eckhardt, BFI and re (Eckhardt)
+
+    Fitted rating curves are kept in out_dir/rating_curves so unchanged sites are
+    not refit. Returns the summary of every finished gauge as a dataframe, which is
+    also written to out_dir/summary.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = sorted(os.path.join(logger_dir, f) for f in os.listdir(logger_dir)
+                   if f.endswith(pattern))
+    sites = {os.path.splitext(os.path.basename(p))[0]: p for p in paths}
+    ratings, fits = {}, {}
+    if rating_table is not None:
+        ratings = read_rating_table(rating_table)
+        unrated = sorted(set(sites) - set(ratings))
+        if unrated and errors == 'raise':
+            raise ValueError(f'no rating curve measurements for {unrated}')
+        for site in unrated:
+            warnings.warn(f'no rating curve measurements for {site}, skipped')
+            del sites[site]
+        with shelve.open(os.path.join(out_dir, 'rating_curves')) as cache:
+            rcs = fit_rating_curves({s: ratings[s] for s in sites}, processes, cache, errors)
+        fits = {s: (rc.popt, rc.pcov) for s, rc in rcs.items()}
+        sites = {s: p for s, p in sites.items() if s in fits}
+
+    summaries, todo = {}, []
+    for site, path in sites.items():
+        rating = ratings.get(site)
+        stamp = _stamp(path, rating, options)
+        done = _read_checkpoint(os.path.join(out_dir, site)) if resume else None
+        if done is not None and done['stamp'] == stamp:
+            summaries[site] = done['summary']
+        else:
+            todo.append((path, out_dir, rating, fits.get(site), dict(options, stamp=stamp)))
+
+    def collect(site, result):
+        try:
+            summaries[site] = result()
+        except Exception as e:
+            if errors == 'raise':
+                raise
+            warnings.warn(f'{site} failed: {e}')
+
+    name = lambda args: os.path.splitext(os.path.basename(args[0]))[0]
+    if processes == 1 or len(todo) < 2:
+        for args in todo:
+            collect(name(args), lambda: process_gauge(*args))
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            futures = {pool.submit(process_gauge, *args): name(args) for args in todo}
+            for future in as_completed(futures):
+                collect(futures[future], future.result)
+
+    summary = pd.DataFrame([summaries[s] for s in sites if s in summaries])
+    if len(summary):
+        write_table(summary, os.path.join(out_dir, 'summary'), options.get('format', 'npz'))
+    return summary
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os, json, pickle, hashlib, uuid
+from collections import OrderedDict
+import numpy as np, pandas as pd
+
+__all__ = ['fingerprint', 'ResultCache']
+
+def fingerprint(*arrays):
+    """Content hash of arrays: their dtypes, shapes and bytes. Returns a hex string."""
+    h = hashlib.blake2b(digest_size=16)
+    for a in arrays:
+        if a is None:
+            h.update(b'None')
+            continue
+        a = np.ascontiguousarray(a)
+        h.update(f'{a.dtype.str}{a.shape}'.encode())
+        h.update(a.view(np.uint8).reshape(-1) if a.size else b'')
+    return h.hexdigest()
+
+def _copy(value):
+    """Arrays and dataframes are copied in and out of the cache so callers can modify them."""
+    return value.copy() if isinstance(value, (np.ndarray, pd.DataFrame, pd.Series)) else value
+
+class ResultCache(object):
+    def __init__(self, directory=None, max_bytes=2**30, memory_items=64):
+        """
+        Memoizes results of Discharge methods, keyed by a fingerprint of the input
+        arrays and the method parameters. Pass it to Discharge(..., cache=...).
+
+        Results are kept in memory (the memory_items most recently used) and, if a
+        directory is given, on disk as pickles. The disk tier is bounded to
+        max_bytes, evicting the least recently used files; a file's modification
+        time records its last use. Files are written under a unique temporary
+        name and renamed into place, so several processes can share one
+        directory. Only share a directory with processes you trust, since the
+        files are unpickled.
+
+        directory: on-disk cache directory, or None for memory only\n
+        max_bytes: size limit of the on-disk tier\n
+        memory_items: number of results kept in memory
+
+        stats counts memory hits, disk hits, misses and evictions.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(name, data, params=()):
+        """Cache key of method name applied to data (a fingerprint) with params."""
+        return hashlib.sha1(json.dumps([name, data, params], default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key, default=None):
+        """Cached value of key (a copy), or default."""
+        if key in self._memory:
+            self.stats['memory_hits'] += 1
+            self._memory.move_to_end(key)
+            return _copy(self._memory[key])
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as fh:
+                    value = pickle.load(fh)
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                # unreadable entry, drop it
+                self._unlink(path)
+            else:
+                self.stats['disk_hits'] += 1
+                self._remember(key, value)
+                return _copy(value)
+        self.stats['misses'] += 1
+        return default
+
+    def put(self, key, value):
+        """Stores a copy of value under key in memory and on disk."""
+        value = _copy(value)
+        self._remember(key, value)
+        if self.directory is None:
+            return
+        tmp = os.path.join(self.directory, f'.{key}.{os.getpid()}.{uuid.uuid4().hex}.tmp')
+        with open(tmp, 'wb') as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def call(self, key, compute):
+        """Cached value of key, or the result of compute() after storing it."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:    # removed by another process
+            return False
+
+    def _evict(self):
+        """Deletes the least recently used files until the directory fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pkl'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self._unlink(path):
+                self.stats['evictions'] += 1
+            total -= size
+
+    def size(self):
+        """Bytes used by the on-disk tier."""
+        if self.directory is None:
+            return 0
+        return sum(e.stat().st_size for e in os.scandir(self.directory) if e.name.endswith('.pkl'))
+
+    def clear(self):
+        """Empties both tiers."""
+        self._memory.clear()
+        if self.directory is not None:
+            for e in os.scandir(self.directory):
+                if e.name.endswith('.pkl'):
+                    self._unlink(e.path)
+
+_MISSING = object()
@@ -1,8 +1,13 @@
-import numpy as np, pandas as pd, matplotlib.pyplot as plt
-from datetime import datetime
-from matplotlib.ticker import FuncFormatter
-from scipy.optimize import curve_fit
-plt.style.use("seaborn-ticks")
+import hashlib, warnings
+import numpy as np, pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from .baseflow import lyne_hollick, eckhardt
+from .resample import AggregatePyramid, as_datetime64, resample as _resample
+from .sketch import FlowDurationSketch
+from .events import EventIndex
+from .cache import fingerprint
+from . import instrument
+from .instrument import instrumented
 
 def exp_curve(x, a, b):
     """Exponential curve used for rating curves"""
@@ -16,135 +21,452 @@ def r_squ(x, y, pred):
     y: dependent variable\n
     pred: predicted values
     """
-    a = 0.0
-    b = 0.0
-    ybar = np.mean(y)
-    for i, yhat in zip(y, pred):
-        a += (i - yhat)**2
-        b += (i - ybar)**2
+    y = np.asarray(y, dtype=float)
+    a = np.sum((y - np.asarray(pred, dtype=float))**2)
+    b = np.sum((y - np.mean(y))**2)
     return 1 - a / b
 
+def loglinear_fit(stage, discharge):
+    """
+    Least squares fit of log(discharge) = log(a) + b*log(stage), using only the
+    points where both are positive. Returns (a, b), or None with fewer than two
+    usable points. Used as the starting guess for the rating curve fit.
+    """
+    x = np.asarray(stage, dtype=float)
+    y = np.asarray(discharge, dtype=float)
+    ok = (x > 0) & (y > 0)
+    if np.count_nonzero(ok) < 2 or np.ptp(x[ok]) == 0:
+        return None
+    b, loga = np.polyfit(np.log(x[ok]), np.log(y[ok]), 1)
+    return np.exp(loga), b
+
+@instrumented()
+def fit_rating_curve(stage, discharge):
+    """curve_fit of exp_curve seeded with the log-linear estimate. Returns popt, pcov."""
+    from scipy.optimize import curve_fit    # scipy.optimize is slow to import
+    return curve_fit(exp_curve, np.asarray(stage, dtype=float), np.asarray(discharge, dtype=float),
+                     p0=loglinear_fit(stage, discharge))
+
+def measurement_key(stage, discharge):
+    """Hash of a set of stage-discharge measurements, used to key fitted curves."""
+    h = hashlib.sha1()
+    for v in (stage, discharge):
+        v = np.ascontiguousarray(v, dtype=float)
+        h.update(str(len(v)).encode())
+        h.update(v.tobytes())
+    return h.hexdigest()
+
+@instrumented()
+def fit_rating_curves(sites, processes=None, cache=None, errors='raise'):
+    """
+    Fits rating curves for many sites at once.
+
+    sites: dictionary of site name to (stage, discharge) measurements\n
+    processes: number of worker processes; None uses one per CPU and 1 fits in this process\n
+    cache: optional dictionary-like store (e.g. a shelve) of fitted (popt, pcov) keyed by
+    measurement_key. Sites whose measurements are already in it are not refit.\n
+    errors: 'raise' to stop on a fit that fails, 'skip' to warn and leave the site out
+
+    Returns a dictionary of site name to RC.
+    """
+    keys = {name: measurement_key(*m) for name, m in sites.items()}
+    fits = {}
+    todo = []
+    for name, key in keys.items():
+        if cache is not None and key in cache:
+            fits[name] = cache[key]
+        else:
+            todo.append(name)
+
+    def collect(name, result):
+        try:
+            fits[name] = result()
+        except (RuntimeError, ValueError, TypeError) as e:
+            if errors == 'raise':
+                raise
+            warnings.warn(f'rating curve fit failed for {name}: {e}')
+            return
+        if cache is not None:
+            cache[keys[name]] = fits[name]
+
+    instrument.count('rating curves cached', len(sites) - len(todo))
+    instrument.count('rating curves fitted', len(todo))
+    if processes == 1 or len(todo) < 2:
+        for name in todo:
+            collect(name, lambda: fit_rating_curve(*sites[name]))
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            futures = {name: pool.submit(fit_rating_curve, *sites[name]) for name in todo}
+            for name, future in futures.items():
+                collect(name, future.result)
+
+    return {name: RC(*sites[name], popt=fits[name][0], pcov=fits[name][1])
+            for name in sites if name in fits}
+
+def fit_rating_curve_batch(stage, discharge, p0=None, max_iter=1000, tol=1e-12):
+    """
+    Least squares fits of exp_curve to many sets of measurements at once, with
+    Levenberg-Marquardt steps taken for every set together. Minimises the same
+    unweighted squared error as curve_fit.
+
+    stage, discharge: arrays shaped (sets, measurements)\n
+    p0: starting (a, b) for each set, shaped (sets, 2); defaults to the
+    log-linear fit of each set
+
+    max_iter: most steps taken; sets that have not converged by then are NaN
+
+    Returns the fitted (a, b) of each set, shaped (sets, 2); NaN where a set
+    cannot be fit (e.g. fewer than two distinct positive stages) or did not
+    converge.
+    """
+    x = np.atleast_2d(np.asarray(stage, dtype=float))
+    y = np.atleast_2d(np.asarray(discharge, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logx = np.where(x > 0, np.log(np.where(x > 0, x, 1)), 0)
+        if p0 is None:
+            # log-linear least squares of each set over its positive points
+            ok = (x > 0) & (y > 0)
+            logy = np.where(ok, np.log(np.where(ok, y, 1)), 0)
+            m = ok.sum(axis=1)
+            mx, my = (logx * ok).sum(axis=1) / m, logy.sum(axis=1) / m
+            dx = np.where(ok, logx - mx[:, np.newaxis], 0)
+            b = (dx * (logy - my[:, np.newaxis])).sum(axis=1) / (dx**2).sum(axis=1)
+            p0 = np.column_stack((np.exp(my - b * mx), b))
+    p = np.array(p0, dtype=float)
+    damping = np.full(len(p), 1e-3)
+
+    def cost(p):
+        with np.errstate(over='ignore', invalid='ignore'):
+            return np.sum((y - p[:, :1] * x**p[:, 1:])**2, axis=1)
+
+    err = cost(p)
+    active = np.isfinite(err)
+    # sets that diverge overflow along the way; they end up NaN below
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        for _ in range(max_iter):
+            if not active.any():
+                break
+            xb = x**p[:, 1:]
+            f = p[:, :1] * xb
+            r = y - f
+            j1, j2 = xb, f * logx
+            # normal equations of each set, damped on the diagonal
+            h11, h12, h22 = (j1 * j1).sum(axis=1), (j1 * j2).sum(axis=1), (j2 * j2).sum(axis=1)
+            g1, g2 = (j1 * r).sum(axis=1), (j2 * r).sum(axis=1)
+            h11, h22 = h11 * (1 + damping), h22 * (1 + damping)
+            det = h11 * h22 - h12**2
+            step = np.column_stack(((h22 * g1 - h12 * g2) / det, (h11 * g2 - h12 * g1) / det))
+            trial = np.where(active[:, np.newaxis], p + step, p)
+            new = cost(trial)
+            better = active & (new <= err)
+            converged = better & (err - new <= tol * np.maximum(err, 1e-300))
+            p[better], err[better] = trial[better], new[better]
+            damping = np.where(better, damping / 10, damping * 10)
+            active &= ~converged & (damping < 1e12)
+    p[active | ~np.isfinite(err) | ~np.isfinite(p).all(axis=1)] = np.nan
+    return p
+
+def _discharge_bands(params, stages, q):
+    """
+    Percentiles q of the discharge at each stage over the parameter sets
+    (sets, 2), shaped (len(q), len(stages)). NaN for negative or missing stages.
+    """
+    stages = np.asarray(stages, dtype=float)
+    bands = np.full((len(q), len(stages)), np.nan)
+    ok = stages >= 0
+    # one row of samples per stage, so each percentile partitions contiguous rows
+    Q = params[:, 0] * stages[ok, np.newaxis]**params[:, 1]
+    bands[:, ok] = np.percentile(Q, q, axis=1)
+    return bands
+
+def _rb_flashiness(Q):
+    """Richards-Baker Flashiness Index along the first axis of daily mean discharges."""
+    Q = np.asarray(Q, dtype=float)
+    # Q[:1] rather than Q[0] so an empty record gives NaN, as 0 / 0
+    Qpath = Q[:1].sum(axis=0) + np.sum(np.abs(np.diff(Q, axis=0)), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return Qpath / np.nansum(Q, axis=0)
+
+def _flow_duration(Q):
+    """
+    Flow duration curve along the first axis of Q.
+
+    Returns the sorted discharges, the exceedance probability of each one and
+    a mask of the entries that are the last of a run of equal values (the unique
+    discharges). NaNs are left out of the counts.
+    """
+    Q = np.sort(np.asarray(Q, dtype=float), axis=0)
+    valid = ~np.isnan(Q)
+    rank = np.cumsum(valid, axis=0)
+    # an all-NaN station has no valid values and divides 0 / 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        prob = 100 - rank / rank[-1:] * 100
+    last = np.ones(Q.shape, dtype=bool)
+    last[:-1] = Q[1:] != Q[:-1]
+    last &= valid
+    return Q, prob, last
+
 class RC(object):
-    def __init__(self, stage, discharge):
+    def __init__(self, stage, discharge, popt=None, pcov=None):
         """
         Stage-Discharge rating curve
 
         stage: pandas series containing stage values correspoding to discharges\n
-        discharge: pandas series containing discharge measurements
+        discharge: pandas series containing discharge measurements\n
+        popt, pcov: previously fitted parameters and covariance, skips the fit
         """
         self.stage = stage
         self.discharge = discharge
-        # curve_fit
-        self.popt, self.pcov = curve_fit(exp_curve, self.stage, self.discharge)
+        # curve_fit, seeded with a log-linear fit
+        if popt is None:
+            popt, pcov = fit_rating_curve(self.stage, self.discharge)
+        self.popt, self.pcov = np.asarray(popt, dtype=float), np.asarray(pcov, dtype=float)
         # r-squared
-        self.pred = [exp_curve(j, self.popt[0], self.popt[1]) for j in self.stage]
+        self.pred = exp_curve(np.asarray(self.stage, dtype=float), self.popt[0], self.popt[1])
         self.r = r_squ(self.stage, self.discharge, self.pred)
 
+    @instrumented()
+    def convert(self, stages, decimals=None):
+        """
+        Compute discharges for an array of stages. Returns a float ndarray.
+
+        decimals: optionally round the discharges to this many decimals
+        """
+        Q = exp_curve(np.asarray(stages, dtype=float), self.popt[0], self.popt[1])
+        if decimals is not None:
+            np.round(Q, decimals, out=Q)
+        return Q
+
     def Q(self, allstages):
-        """ Compute discharges for entire series of stages"""
-        return list(map(lambda x: round(exp_curve(x, self.popt[0], self.popt[1]), 3), allstages))
+        """ Compute discharges for entire series of stages, rounded to 3 decimals, as a list"""
+        return self.convert(allstages, 3).tolist()
+
+    def sample(self, n_samples=1000, method='pcov', seed=None):
+        """
+        Samples of the rating curve parameters, shaped (n_samples, 2).
+
+        method: 'pcov' draws from a normal distribution with the fitted
+        covariance; 'bootstrap' refits resampled measurements, all at once with
+        fit_rating_curve_batch\n
+        seed: seed or numpy Generator, for reproducible samples
+        """
+        rng = np.random.default_rng(seed)
+        if method == 'pcov':
+            return rng.multivariate_normal(self.popt, self.pcov, n_samples)
+        if method == 'bootstrap':
+            x = np.asarray(self.stage, dtype=float)
+            y = np.asarray(self.discharge, dtype=float)
+            idx = rng.integers(0, len(x), (n_samples, len(x)))
+            return fit_rating_curve_batch(x[idx], y[idx], np.tile(self.popt, (n_samples, 1)))
+        raise ValueError("method must be 'pcov' or 'bootstrap'")
+
+    @instrumented()
+    def bands(self, stages, percentiles=(2.5, 50, 97.5), n_samples=1000, method='pcov',
+              seed=None, max_bytes=2**27, processes=None):
+        """
+        Uncertainty bands of the discharge for a series of stages. Parameter
+        samples from RC.sample are pushed through the rating curve for blocks of
+        stages sized to max_bytes, so long series use bounded memory.
+
+        percentiles: percentiles (0-100) of discharge to return\n
+        n_samples, method, seed: as in RC.sample\n
+        processes: spread the blocks over this many worker processes (None runs
+        in this process); the samples, and so the result, do not depend on it
+
+        Returns a dataframe of the stage and one column per percentile, e.g. 'Q2.5'.
+        Bootstrap samples that could not be fit or did not converge are left out.
+        """
+        params = self.sample(n_samples, method, seed)
+        params = params[np.isfinite(params).all(axis=1)]
+        stages = np.asarray(stages, dtype=float).ravel()
+        # loggers record stage to a fixed resolution, so each distinct stage is
+        # evaluated once
+        unique, inverse = np.unique(stages, return_inverse=True)
+        # a few (block x samples) arrays are alive per block
+        block = max(int(max_bytes // (3 * 8 * max(len(params), 1))), 1)
+        blocks = [unique[i:i+block] for i in range(0, len(unique), block)]
+        if processes is None:
+            out = [_discharge_bands(params, b, percentiles) for b in blocks]
+        else:
+            with ProcessPoolExecutor(processes) as pool:
+                out = list(pool.map(_discharge_bands, [params] * len(blocks), blocks,
+                                    [percentiles] * len(blocks)))
+        values = np.concatenate(out, axis=1) if out else np.zeros((len(percentiles), 0))
+        bands = pd.DataFrame({'stage': stages})
+        for p, v in zip(percentiles, values):
+            bands[f'Q{p:g}'] = v[inverse]
+        return bands
 
     def plot(self, title='Rating Curve', log=True):
         """ plot the rating curve """
-        fig = plt.figure()
-        ax1 = fig.add_subplot(111, facecolor=[.95,.95,.95])
-        plt.grid(True, which='both', color='w', ls='-', zorder=0)
-        ax1.scatter(self.stage, self.discharge, color='k', s=10)
-        ax1.set_ylabel(r'Discharge, cfs')
-        ax1.set_xlabel(r'Stage, ft')
-        if log:
-            ax1.set_ylim(0.01, 100)
-            ax1.set_yscale('log'); ax1.set_xscale('log')                              # log scale x and y
-            ax1.yaxis.set_major_formatter(FuncFormatter(lambda y,pos: ('{{:.{:1d}f}}'.format(int(np.maximum(-np.log10(y),0)))).format(y)))
-            ax1.xaxis.set_major_formatter(FuncFormatter(lambda y,pos: ('{{:.{:1d}f}}'.format(int(np.maximum(-np.log10(y),0)))).format(y)))
-        plt.title(title)
-        ax1.set_axisbelow(True)         # puts grid below plot
-
-        # write the equation in the plot
-        ax1.text(0.05, 0.7, f'y = {self.popt[0]:.3f}x^{self.popt[1]:.3f}',
-                 fontsize=15, transform=ax1.transAxes)
-        # draw the model line
-        line = np.linspace(min(self.stage), max(self.stage), 100)
-        ax1.plot(line, exp_curve(line, self.popt[0], self.popt[1]), color='k')
-        plt.show()
+        from .plotting import plot_rating_curve
+        plot_rating_curve(self, title, log)
 
 class Discharge(object):
-    def __init__(self, time, Q, rain=[]):
+    __slots__ = ('time', 'Q', 'rain', 'bflow', 'cache', '_pyramid', '_fingerprint', '_events')
+
+    def __init__(self, time, Q, rain=None, dtype=np.float64, cache=None):
         """
-        time: timeseries
+        time: timeseries (or None)
         Q: discharge values
+        rain: optional rainfall values
+        dtype: storage type for Q, rain and baseflow; np.float32 halves memory
+        cache: optional ResultCache that memoizes resample, dailyQ, RB_Flashiness,
+        flow_duration and the baseflow filters by the content of the series
+
+        Inputs are stored as contiguous NumPy arrays (time as datetime64[ns]).
+        Arrays that already have that layout, such as memory mapped logger
+        columns, are used without copying.
         """
-        self.time = time
-        self.Q = Q
-        self.rain = rain
-        self.bflow = []
+        self.time = None if time is None else as_datetime64(time)
+        self.Q = np.ascontiguousarray(Q, dtype=dtype)
+        self.rain = np.ascontiguousarray([] if rain is None else rain, dtype=dtype)
+        self.bflow = np.zeros(0, dtype=dtype)
+        self.cache = cache
+        self._pyramid = None
+        self._fingerprint = None
+        self._events = None
+
+    def _cached(self, name, params, compute, data=None):
+        """
+        Result of compute(), looked up in self.cache by name, params and the
+        content of data (default time and Q).
+        """
+        if self.cache is None:
+            return compute()
+        if data is None:
+            # hashed once per Q and time arrays, like the pyramid
+            fp = self._fingerprint
+            if fp is None or fp[0] is not self.Q or fp[1] is not self.time:
+                self._fingerprint = (self.Q, self.time, fingerprint(self.time, self.Q))
+            data = self._fingerprint[2]
+        else:
+            data = fingerprint(data)
+        return self.cache.call(self.cache.key(name, data, params), compute)
+
+    def append(self, time, Q, rain=None):
+        """
+        Adds rows to the end of the record (e.g. newly downloaded logger data).
+        An event index built by events() is updated for the new rows only; any
+        baseflow computed so far is dropped, since it no longer covers the record.
+        """
+        Q = np.asarray(Q, dtype=self.Q.dtype)
+        if len(self.rain) or rain is not None:
+            if rain is None or len(self.rain) != len(self.Q):
+                raise ValueError('rain must be given for every row, or for none')
+            self.rain = np.concatenate((self.rain, np.asarray(rain, dtype=self.Q.dtype)))
+        self.time = np.concatenate((self.time, as_datetime64(time)))
+        self.Q = np.concatenate((self.Q, Q))
+        self.bflow = np.zeros(0, dtype=self.Q.dtype)
+        if self._events is not None:
+            params, _, index = self._events
+            self._events = (params, self.Q, index.update(self.time, self.Q, self.rain))
+        return self
+
+    @instrumented()
+    def events(self, min_gap='6h', min_rain=0.0, end_fraction=.1):
+        """
+        EventIndex of the storm events in the record: rain event start and end,
+        hydrograph peak and recession end, and per event rain, peak flow, lag,
+        rise and recession times and runoff volume. Built once and kept; append
+        updates it.
+
+        min_gap: longest dry spell inside one rain event, e.g. '6h'\n
+        min_rain: rain at or below this counts as dry\n
+        end_fraction: share of the rise left when the recession is over
+
+        Query it with .select(min_peak=..., start='2015', end='2016') or .top(n).
+        """
+        if len(self.rain) != len(self.Q):
+            raise ValueError('events need rain for every discharge value')
+        params = (min_gap, min_rain, end_fraction)
+        if self._events is None or self._events[0] != params or self._events[1] is not self.Q:
+            self._events = (params, self.Q, EventIndex(self.time, self.Q, self.rain, *params))
+        return self._events[2]
 
+    def slice(self, start=None, end=None):
+        """
+        Discharge for the times start <= time < end (datetimes or strings, either
+        may be None). Time must be sorted. The new object's arrays are views of
+        this one's, not copies, including any baseflow already computed. Baseflow
+        filters never write into an existing buffer, so filtering the slice leaves
+        this object's baseflow unchanged and vice versa.
+        """
+        i = 0 if start is None else np.searchsorted(self.time, np.datetime64(start, 'ns'))
+        j = len(self.Q) if end is None else np.searchsorted(self.time, np.datetime64(end, 'ns'))
+        part = Discharge(self.time[i:j], self.Q[i:j],
+                         self.rain[i:j] if len(self.rain) else None, self.Q.dtype, self.cache)
+        if len(self.bflow):
+            part.bflow = self.bflow[i:j]
+        return part
+
+    @instrumented()
+    def resample(self, freq='day', method='mean'):
+        """
+        Aggregates the discharge into 'hour', 'day', 'month' or 'wateryear' bins
+        using the 'mean', 'sum', 'min', 'max' or 'count' of each bin. NaNs are ignored.
+
+        The aggregates of every level are computed on the first call and reused,
+        so switching between levels and methods does not rescan the series.\n
+        Returns the start of each bin and the aggregated flow in a dataframe.
+        """
+        def compute():
+            # the pyramid is rebuilt if Q has been replaced since it was built
+            if self._pyramid is None or self._pyramid[0] is not self.Q:
+                self._pyramid = (self.Q, AggregatePyramid(self.time, self.Q))
+                instrument.count('aggregate pyramids built')
+            bins, values = self._pyramid[1].get(freq, method)
+            return pd.DataFrame({freq: bins, method + 'Q': values})
+        return self._cached('resample', [freq, method], compute)
+
+    @instrumented()
     def dailyQ(self, method='mean'):
         """
         Calculates the daily flow of a set of disharge data.
 
-        Method specifies the method of aggregating each day -- either by 'mean'
-        or by 'sum'. Default is mean.\n
+        Method specifies the method of aggregating each day -- 'mean', 'sum',
+        'min', 'max' or 'count'. Default is mean.\n
         Returns daily flow and day in a dataframe.
         """
-        daily = pd.DataFrame({'Q':self.Q, 'time':self.time})
-        daily['day'] = daily.time.apply(lambda x: datetime(x.year, x.month, x.day))
-        if method == 'mean':
-            daily = pd.DataFrame(daily.groupby(['day'])['Q'].mean())
-            daily['meanQ'] = daily['Q']
-            del daily['Q']
-        elif method == 'sum':
-            daily = pd.DataFrame(daily.groupby(['day'])['Q'].sum())
-            daily['sumQ'] = daily['Q']
-            del daily['Q']
-        daily.reset_index(inplace=True)
-        return daily
+        return self.resample('day', method)
 
+    @instrumented()
     def RB_Flashiness(self):
         """Richards-Baker Flashiness Index for a series of daily mean discharges."""
-        Q = self.dailyQ().meanQ
-        Qsum = np.sum(Q)      # sum of daily mean discharges
-        Qpath = 0.0
-        for i in range(len(Q)):
-            if i == 0:
-                Qpath = Q.iloc[i]   # first entry only
-            else:
-                Qpath += np.abs(Q.iloc[i] - Q.iloc[i-1])  # sum the absolute differences of the mean discharges
-        return Qpath/Qsum
+        return self._cached('RB_Flashiness', [], lambda: _rb_flashiness(self.dailyQ().meanQ))
 
+    def fdc_sketch(self, eps=.01, seed=None):
+        """
+        FlowDurationSketch of the discharge. Sketches from different periods or
+        gauges can be merged, and updated as new data arrives.
+
+        eps: target rank error as a fraction of the number of values
+        """
+        return FlowDurationSketch(eps, seed).update(self.Q)
 
-    def flow_duration(self, plot=False):
+    @instrumented()
+    def flow_duration(self, plot=False, eps=None):
         """
-        Creates the flow duration curve for a discharge dataset. Returns a pandas
-        series whose index is the discharge values and series is exceedance probability.
+        Creates the flow duration curve for a discharge dataset. Returns a dataframe
+        of the unique discharge values in increasing order and the exceedance
+        probability (percent) of each.
+
+        The curve is exact by default. Give eps to build it from a FlowDurationSketch
+        instead, in constant memory with a rank error of about eps.
         """
-        fd = pd.Series(self.Q).value_counts()               # frequency of unique values
-        fd.sort_index(inplace=True)                         # sort in order of increasing discharges
-        fd = fd.cumsum()                                    # cumulative sum of frequencies
-        fd = fd.apply(lambda x: 100 - x/fd.max() * 100)     # normalize
-        fd = pd.DataFrame(fd.reset_index())
-        fd['exeedance_prob'] = fd['index']; del fd['index']
+        def compute():
+            if eps is None:
+                Q, prob, last = _flow_duration(self.Q)
+                return pd.DataFrame({'discharge_cfs': Q[last], 'exeedance_prob': prob[last]})
+            return self.fdc_sketch(eps).flow_duration()
+        fd = self._cached('flow_duration', [eps], compute)
 
         if plot:
-            import probscale # flow duration curves use a probability scale for the x axis
-            fig = plt.figure(figsize=[8, 10])
-            ax1 = fig.add_subplot(111, facecolor=[.95,.95,.95])
-            plt.grid(True, which='both', color='w', ls='-', zorder=0)
-            ax1.plot(fd['discharge_cfs'], fd['exeedance_prob'], 'x', ls='',
-                     color='k', label='Total Flow', ms=5)
-
-            # set y axis to log scale and x axis to probability scale
-            ax1.set_yscale('log')
-            ax1.set_xscale('prob') # from import probscale
-            plt.xticks([.01,.1,.5,1,2,5,10,20,30,40,50,60,70,80,90,95,98,99,99.5,99.9,99.99],
-                       rotation='vertical')
-            plt.legend()
-            plt.title('Flow Duration Curve')
-            plt.ylabel('Flow (cfs)')
-            plt.xlabel('Percentage of time flow was equaled or exceeded')
-            plt.show()
+            from .plotting import plot_flow_duration
+            plot_flow_duration(fd)
         return fd
 
+    @instrumented()
     def Lyne_Hollick(self, alpha=.925, direction='f'):
         """
         Recursive digital filter for baseflow separation. Based on Lyne and Hollick, 1979.
@@ -153,32 +475,16 @@ class Discharge(object):
         alpha : filter parameter\n
         direction : (f)orward or (r)everse calculation
         """
-        # first looks to see if there has alread been a run
-        if len(self.bflow) > 0:
-            Q = np.array(self.bflow)
-        else:
-            Q = np.array(self.Q)
-        f = np.zeros(len(Q))
-        if direction[0] == 'f':
-            for t in np.arange(1,len(Q)):
-                # algorithm
-                f[t] = alpha * f[t-1] + (1 + alpha)/2 * (Q[t] - Q[t-1])
-                # to prevent negative values
-                if Q[t] - f[t] > Q[t]:
-                    f[t] = 0
-        elif direction[0] == 'r':
-            for t in np.arange(len(Q)-2, 1, -1):
-                f[t] = alpha * f[t+1] + (1 + alpha)/2 * (Q[t] - Q[t+1])
-                if Q[t] - f[t] > Q[t]:
-                    f[t] = 0
-        # adds the baseflow to self variables so it can be called recursively
-        self.bflow = np.array(Q - f)
-        # calls method again if multiple passes are specified
-        if len(direction) > 1:
-            self.Lyne_Hollick(alpha, direction=direction[1:])
-        
+        # a previous run is filtered again, otherwise Q; the result is always a
+        # new buffer so arrays returned earlier (or held by slices) are unchanged
+        if self.cache is not None:
+            return self._cached_baseflow('Lyne_Hollick', [alpha, direction],
+                                         lambda Q: lyne_hollick(Q, alpha, direction))
+        src = self.bflow if len(self.bflow) > 0 else self.Q
+        self.bflow = lyne_hollick(src, alpha, direction, out=np.empty_like(src))
         return self.bflow
 
+    @instrumented()
     def Eckhardt(self, alpha=.98, BFI=.80, re=1):
         """
         Recursive digital filter for baseflow separation. Based on Eckhardt, 2004.\n
@@ -187,56 +493,126 @@ class Discharge(object):
         BFI : BFI_max (maximum baseflow index)\n
         re : number of times to run filter
         """
-        print('round ' + str(re))
-        print(self.bflow[:5])
-        # first looks to see if there has alread been a run
-        if len(self.bflow) > 0:
-            Q = np.array(self.bflow)
-        else:
-            Q = np.array(self.Q)
-        f = np.zeros(len(Q))
-        f[0] = Q[0]
-        for t in np.arange(1,len(Q)):
-            # algorithm
-            f[t] = ((1 - BFI) * alpha * f[t-1] + (1 - alpha) * BFI * Q[t]) / (1 - alpha * BFI)
-            if f[t] > Q[t]:
-                f[t] = Q[t]
-        # adds the baseflow to self variables so it can be called recursively
-        self.bflow = f
-        print(max(self.bflow))
-        # calls method again if multiple passes are specified
-        if re > 1:
-            self.Eckhardt(alpha=alpha, BFI=BFI, re=re-1)
+        # a previous run is filtered again, otherwise Q; the result is always a
+        # new buffer so arrays returned earlier (or held by slices) are unchanged
+        if self.cache is not None:
+            return self._cached_baseflow('Eckhardt', [alpha, BFI, re],
+                                         lambda Q: eckhardt(Q, alpha, BFI, re))
+        src = self.bflow if len(self.bflow) > 0 else self.Q
+        self.bflow = eckhardt(src, alpha, BFI, re, out=np.empty_like(src))
+        return self.bflow
 
+    def _cached_baseflow(self, name, params, run):
+        """Baseflow filter through the cache, keyed by the series being filtered."""
+        src = self.bflow if len(self.bflow) > 0 else self.Q
+        self.bflow = self._cached(name, params, lambda: run(src), data=src)
         return self.bflow
 
-    def plot(self, addseries=[], log=True, title='Discharge'):
+    def plot(self, addseries=[], log=True, title='Discharge', full=False):
         """
         Quick plot with or without rain data.\n
         If you wish to plot more than one series to compare them, use addseries
-        to list in order of [time, Q, ...] for each additional series.
-        """
-        fig = plt.figure()
-        ax1 = fig.add_subplot(111, facecolor=[.95,.95,.95])
-        plt.grid(True, which='both', color='w', ls='-', zorder=0)
-        ax1.plot(self.time, self.Q, label='Series1')
-        if len(self.rain) != 0:
-            ax2 = ax1.twinx()
-            ax2.plot(self.time, self.rain, alpha=.5, c='b', lw=1, label='Rain')
-            ax2.set_ylim(1, 0)
-            ax2.set_ylabel(r'Rain, in')
-        ax1.set_ylabel('Discharge, cfs')
-        ax1.set_xlabel('Stage, ft')
-        # log scale for y axis
-        if log:
-            ax1.set_yscale('log')
-            ax1.yaxis.set_major_formatter(FuncFormatter(lambda y,pos: ('{{:.{:1d}f}}'.format(int(np.maximum(-np.log10(y),0)))).format(y)))
-        # add ablity to plot multiple time series
-        more = len(addseries)
-        while more > 0:
-            ax1.plot(addseries[more-2], addseries[more-1],
-                     label=f'Series{int(len(addseries)/2-more/2 +2)}')
-            more -= 2
-        ax1.legend(loc='best')
-        plt.title(title)
-        plt.show()
+        to list in order of [time, Q, ...] for each additional series.\n
+        Long series are decimated to the plot width, keeping peaks; set full=True
+        to draw every point.
+        """
+        from .plotting import plot_discharge
+        plot_discharge(self, addseries, log, title, full)
+
+class DischargeSet(object):
+    def __init__(self, time, Q, stations=None):
+        """
+        Discharge for many stations sharing one time axis. Each method runs on
+        all stations at once and matches the Discharge method of the same name.
+
+        time: timeseries\n
+        Q: 2-D array of discharge values (time x station), or a dataframe with
+        one column per station\n
+        stations: station names, defaults to the dataframe columns or 0..n-1
+        """
+        if stations is None:
+            stations = Q.columns if isinstance(Q, pd.DataFrame) else range(np.shape(Q)[1])
+        self.time = time
+        self.Q = np.asarray(Q, dtype=float)
+        self.stations = list(stations)
+        if self.Q.ndim != 2 or self.Q.shape[1] != len(self.stations):
+            raise ValueError('Q must be a 2-D array with one column per station')
+        if len(self.time) != len(self.Q):
+            raise ValueError('time and Q must have the same length')
+        self.bflow = []
+
+    @classmethod
+    def from_discharge(cls, series, stations=None):
+        """Stacks Discharge objects that share the same time axis."""
+        series = list(series)
+        Q = np.column_stack([np.asarray(d.Q, dtype=float) for d in series])
+        return cls(series[0].time, Q, stations)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __getitem__(self, station):
+        """Discharge object for a single station."""
+        return Discharge(self.time, self.Q[:, self.stations.index(station)])
+
+    @instrumented()
+    def dailyQ(self, method='mean'):
+        """
+        Calculates the daily flow of every station.
+
+        Method specifies the method of aggregating each day -- 'mean', 'sum',
+        'min', 'max' or 'count'. Default is mean.\n
+        Returns a dataframe with the day and one column per station.
+        """
+        bins, values = _resample(self.time, self.Q, 'day', method)
+        daily = pd.DataFrame(values, columns=self.stations)
+        daily.insert(0, 'day', bins)
+        return daily
+
+    @instrumented()
+    def RB_Flashiness(self):
+        """Richards-Baker Flashiness Index of every station, as a series indexed by station."""
+        daily = self.dailyQ()[self.stations].values
+        return pd.Series(_rb_flashiness(daily), index=self.stations)
+
+    @instrumented()
+    def flow_duration(self):
+        """
+        Flow duration curve of every station. Returns a dictionary of station to
+        the dataframe returned by Discharge.flow_duration.
+        """
+        Q, prob, last = _flow_duration(self.Q)
+        return {s: pd.DataFrame({'discharge_cfs': Q[last[:, i], i],
+                                 'exeedance_prob': prob[last[:, i], i]})
+                for i, s in enumerate(self.stations)}
+
+    @instrumented()
+    def Lyne_Hollick(self, alpha=.925, direction='f'):
+        """
+        Lyne and Hollick baseflow separation of every station.
+
+        alpha : filter parameter\n
+        direction : (f)orward or (r)everse calculation
+        """
+        if len(self.bflow) > 0:
+            Q = self.bflow
+        else:
+            Q = self.Q
+        self.bflow = lyne_hollick(Q, alpha, direction)
+        return self.bflow
+
+    @instrumented()
+    def Eckhardt(self, alpha=.98, BFI=.80, re=1):
+        """
+        Eckhardt baseflow separation of every station.
+
+        alpha : filter parameter\n
+        BFI : BFI_max (maximum baseflow index)\n
+        re : number of times to run filter
+        """
+        if len(self.bflow) > 0:
+            Q = self.bflow
+        else:
+            Q = self.Q
+        self.bflow = eckhardt(Q, alpha, BFI, re)
+        return self.bflow
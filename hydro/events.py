@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np, pandas as pd
+from .resample import as_datetime64
+
+__all__ = ['EventIndex']
+
+_INDEX = ('start', 'rain_end', 'peak', 'end')
+_STATS = ('rain', 'centroid', 'peak_Q', 'volume', 'runoff')
+
+def _first(mask, starts, stops, default):
+    """First index i with starts <= i < stops where mask is true, else default."""
+    hits = np.flatnonzero(mask)
+    if len(hits) == 0:
+        return np.asarray(default, dtype=np.int64).copy()
+    j = np.searchsorted(hits, starts)
+    pos = hits[np.minimum(j, len(hits) - 1)]
+    return np.where((j < len(hits)) & (pos < stops), pos, default)
+
+def _scan(t, Q, rain, min_gap, min_rain, end_fraction):
+    """
+    Finds the events of one stretch of record in a single pass of vectorized
+    operations. Returns a dictionary of arrays, indices relative to the stretch.
+    """
+    n = len(Q)
+    wet = np.flatnonzero(rain > min_rain)
+    if len(wet) == 0:
+        return {k: np.zeros(0, dtype=np.int64 if k in _INDEX else float) for k in _INDEX + _STATS}
+    # rain events are wet steps with no dry spell longer than min_gap between them
+    new = np.r_[True, np.diff(t[wet]) > min_gap]
+    start = wet[new]
+    rain_end = wet[np.r_[new[1:], True]]
+    # each event's response window runs to the start of the next rain event
+    stop = np.r_[start[1:], n]
+    lengths = stop - start
+
+    Qf = np.where(np.isnan(Q), -np.inf, Q)
+    peak_Q = np.maximum.reduceat(Qf, start)
+    seg_peak = np.full(n, np.inf)
+    seg_peak[start[0]:] = np.repeat(peak_Q, lengths)
+    peak = _first(Qf == seg_peak, start, stop, start)
+
+    # the recession ends where flow falls back to within end_fraction of the rise
+    q0 = np.nan_to_num(Q[start])
+    threshold = q0 + end_fraction * (peak_Q - q0)
+    seg_thr = np.full(n, -np.inf)
+    seg_thr[start[0]:] = np.repeat(threshold, lengths)
+    end = _first((Qf <= seg_thr) & (Qf > -np.inf), peak + 1, stop, stop - 1)
+
+    # seconds each value stands for, the last repeating the step before it
+    dt = np.diff(t).astype('timedelta64[ns]').astype(np.int64) / 1e9
+    dt = np.r_[dt, dt[-1] if len(dt) else 0.0]
+    elapsed = (t - t[0]).astype('timedelta64[ns]').astype(np.int64) / 1e9
+    # seconds since the start of each event's window
+    since = np.zeros(n)
+    since[start[0]:] = elapsed[start[0]:] - np.repeat(elapsed[start], lengths)
+    wet_rain = np.where(rain > min_rain, rain, 0)
+
+    def sums(x, lo, hi):
+        # sum of x over lo <= i < hi for each event, from the event's own rows
+        return np.add.reduceat(np.r_[x, 0], np.column_stack((lo, hi)).ravel())[::2]
+
+    total = sums(wet_rain, start, rain_end + 1)
+    volume = sums(np.nan_to_num(Q) * dt, start, end + 1)
+    # runoff above a straight baseline from the start to the end of the event
+    duration = since[end] + dt[end]
+    baseline = (q0 + np.nan_to_num(Q[end])) / 2 * duration
+    return {'start': start, 'rain_end': rain_end, 'peak': peak, 'end': end,
+            'rain': total, 'centroid': sums(wet_rain * since, start, rain_end + 1) / total,
+            'peak_Q': np.where(np.isinf(peak_Q), np.nan, peak_Q),
+            'volume': volume, 'runoff': np.maximum(volume - baseline, 0)}
+
+class EventIndex(object):
+    def __init__(self, time, Q, rain, min_gap='6h', min_rain=0.0, end_fraction=.1):
+        """
+        Storm events of a discharge record, found in one pass and kept as compact
+        arrays so queries do not rescan the series.
+
+        A rain event is a run of steps with more than min_rain of rain and no dry
+        spell longer than min_gap. Its hydrograph response runs from the start
+        of the rain to the start of the next rain event: the peak is the highest
+        flow in that window, and the recession ends where flow first falls back
+        to within end_fraction of the rise above the starting flow.
+
+        time, Q, rain: the record (time sorted)\n
+        min_gap: longest dry spell inside one rain event, e.g. '6h'\n
+        min_rain: rain at or below this counts as dry\n
+        end_fraction: share of the rise left when the recession is over
+
+        Per event: rain total and rain centroid, peak flow and its time, lag
+        (rain centroid to peak), rise and recession times, the flow volume of the
+        event and the runoff volume above a straight baseline. Volumes are flow
+        times seconds, e.g. cubic feet for cfs.
+        """
+        self.min_gap = pd.Timedelta(min_gap).to_timedelta64().astype('timedelta64[ns]')
+        self.min_rain = min_rain
+        self.end_fraction = end_fraction
+        self.n = 0
+        self.arrays = {k: np.zeros(0, dtype=np.int64 if k in _INDEX else float)
+                       for k in _INDEX + _STATS}
+        self.update(time, Q, rain)
+
+    def __len__(self):
+        return len(self.arrays['start'])
+
+    def update(self, time, Q, rain):
+        """
+        Indexes rows appended since the last update. time, Q and rain are the
+        whole record, with the rows already indexed unchanged. Only the rows
+        from the start of the last event on are scanned again, since that event's
+        window was still open.
+        """
+        time, Q, rain = as_datetime64(time), np.asarray(Q, dtype=float), np.asarray(rain, dtype=float)
+        if len(rain) != len(Q) or len(time) != len(Q):
+            raise ValueError('time, Q and rain must have the same length')
+        if len(Q) < self.n:
+            raise ValueError('the record is shorter than the rows already indexed')
+        # rows before self.n without an event had no rain, so scanning resumes
+        # at the last event's start or at the first new row
+        keep = max(len(self) - 1, 0)
+        restart = int(self.arrays['start'][-1]) if len(self) else self.n
+        found = _scan(time[restart:], Q[restart:], rain[restart:], self.min_gap,
+                      self.min_rain, self.end_fraction)
+        for k in _INDEX:
+            found[k] = found[k] + restart
+        self.arrays = {k: np.concatenate((self.arrays[k][:keep], found[k])) for k in _INDEX + _STATS}
+        self.n = len(Q)
+        self._time = time
+        return self
+
+    def table(self, which=None):
+        """
+        Dataframe of the events (all, or those selected by an index or mask
+        array), one row per event.
+        """
+        a = self.arrays if which is None else {k: v[which] for k, v in self.arrays.items()}
+        t = self._time
+        start, peak, end = t[a['start']], t[a['peak']], t[a['end']]
+        centroid = start + (a['centroid'] * 1e9).astype('timedelta64[ns]')
+        hours = lambda d: d.astype('timedelta64[ns]').astype(np.int64) / 3.6e12
+        return pd.DataFrame({
+            'start': start, 'rain_end': t[a['rain_end']], 'rain': a['rain'],
+            'peak_time': peak, 'peak_Q': a['peak_Q'], 'lag_hours': hours(peak - centroid),
+            'rise_hours': hours(peak - start), 'end': end, 'recession_hours': hours(end - peak),
+            'volume': a['volume'], 'runoff': a['runoff']})
+
+    def select(self, min_peak=None, start=None, end=None, min_rain=None):
+        """
+        Events with a peak of at least min_peak, peaking at start <= time < end
+        (datetimes or strings such as '2015'), with at least min_rain of rain.
+        Returns a dataframe like table.
+        """
+        a = self.arrays
+        mask = np.ones(len(self), dtype=bool)
+        if min_peak is not None:
+            mask &= a['peak_Q'] >= min_peak
+        if min_rain is not None:
+            mask &= a['rain'] >= min_rain
+        peak_time = self._time[a['peak']]
+        if start is not None:
+            mask &= peak_time >= np.datetime64(pd.Timestamp(start), 'ns')
+        if end is not None:
+            mask &= peak_time < np.datetime64(pd.Timestamp(end), 'ns')
+        return self.table(mask)
+
+    def top(self, n=10, by='peak_Q'):
+        """The n events with the largest peak_Q (or rain, volume, runoff), largest first."""
+        values = np.nan_to_num(self.arrays[by], nan=-np.inf)
+        n = min(n, len(values))
+        idx = np.argpartition(-values, n - 1)[:n] if n else np.zeros(0, dtype=int)
+        return self.table(idx[np.argsort(-values[idx], kind='stable')])
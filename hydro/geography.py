@@ -1,7 +1,49 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import numpy as np, matplotlib.pyplot as plt
+from functools import lru_cache
+import numpy as np
+from . import instrument
+from .instrument import instrumented
 
+# meters per unit for the units reproject can convert to
+LINEAR_UNITS = {'m': 1.0, 'ft': 0.3048, 'us-ft': 1200 / 3937}
+
+@lru_cache(maxsize=None)
+def _transformer(src, dst):
+    import pyproj   # only needed for reprojection
+    return pyproj.Transformer.from_crs(src, dst, always_xy=True)
+
+@instrumented()
+def reproject(x, y, dst, src='EPSG:4326', units=None):
+    """
+    Reprojects whole coordinate arrays in one call, e.g. stream lon/lat into
+    a state plane system for sinuosity and IDW. Transformers are cached per
+    (src, dst) pair, so repeated calls do not rebuild them. Requires pyproj.
+
+    x, y: coordinates in src (longitude and latitude for geographic systems)\n
+    dst: target coordinate system, anything pyproj.CRS accepts (e.g. 'EPSG:2239')\n
+    src: source coordinate system, default WGS84 lon/lat\n
+    units: 'm', 'ft' or 'us-ft' (US survey feet) to convert the output to;
+    default keeps the units of dst
+
+    Returns Easting and Northing arrays.
+    """
+    t = _transformer(src, dst)
+    X, Y = t.transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+    if units is not None:
+        if units not in LINEAR_UNITS:
+            raise ValueError(f'units must be one of {tuple(LINEAR_UNITS)}')
+        crs = t.target_crs
+        if crs.is_geographic:
+            raise ValueError(f'{dst} is geographic and has no linear units')
+        factor = crs.axis_info[0].unit_conversion_factor / LINEAR_UNITS[units]
+        if factor != 1:
+            X *= factor
+            Y *= factor
+    return X, Y
+
+@instrumented()
 def sinuosity(Easting, Northing, length, distance):
     """Calculates sinuosity at each data point. Easting and Northing are lat/longs
     projected into measureable units. Length is distance to calculate the
@@ -21,61 +63,153 @@ def sinuosity(Easting, Northing, length, distance):
     else:
 
         # Calculate sinuosity: stream length / straight line distance
-        sin = np.zeros(len(East))
         l = len(East)
-        b = pnts * 2 * distance  # calculates stream distance for pnts in middle of dataset
-        for i in range(int(l)):
-            if i < pnts: # first few points
-                a = (i + pnts) * distance # calculates stream distance
-                sin[i] = a / np.sqrt(np.abs(East[i+pnts] - East[0])**2
-                         + np.abs(North[i+pnts] - North[0])**2)
-            elif len(sin)-i < pnts +1: # last few points
-                a = (len(sin)-i + pnts) * distance
-                sin[i] = a /np.sqrt(np.abs(East[len(sin)-1] - East[i-pnts])**2
-                         + np.abs(North[len(sin)-1] - North[i-pnts])**2)
-            else: # most points are evaluated here
-                sin[i] = b / np.sqrt(np.abs(East[i+pnts] - East[i-pnts])**2
-                         + np.abs(North[i+pnts] - North[i-pnts])**2)
+        i = np.arange(l)
+        first = i < pnts                        # first few points
+        last = ~first & (l - i < pnts + 1)      # last few points
+        lo = np.where(first, 0, i - pnts)
+        hi = np.where(last, l - 1, i + pnts)
+        # calculates stream distance; pnts * 2 * distance for pnts in middle of dataset
+        a = np.where(first, (i + pnts) * distance,
+                     np.where(last, (l - i + pnts) * distance, pnts * 2 * distance))
+        sin = a / np.sqrt(np.abs(East[hi] - East[lo])**2
+                          + np.abs(North[hi] - North[lo])**2)
         return sin
 
+@instrumented()
+def network_sinuosity(Easting, Northing, length, offsets=None, chainage=None, distance=None):
+    """
+    Calculates sinuosity at each point of many reaches at once, with irregular
+    point spacing. Sinuosity is the channel length between the points 'length'
+    upstream and downstream of a point (or the reach ends) divided by the straight
+    line distance between them.
+
+    Easting, Northing: projected coordinates of all reaches, concatenated\n
+    length: distance along the channel on either side of each point, in map units\n
+    offsets: start index of each reach plus the total number of points, e.g.
+    [0, 120, 450]; default is a single reach\n
+    chainage: along-channel distance of each point from its reach start, defaults
+    to the cumulative distance between points\n
+    distance: uniform channel distance between points, as in sinuosity(); use it
+    instead of chainage to reproduce sinuosity()
+
+    Returns a flat array of sinuosity, one value per point.
+
+    This is not a drop-in replacement for sinuosity(). By default channel
+    lengths come from the chainage, not from a nominal spacing, and the last
+    points of a reach use their true channel length to the reach end, where
+    sinuosity() counts one spacing more, (l - i + pnts) * distance. Give
+    distance to get sinuosity()'s values, e.g. network_sinuosity(E, N, 500,
+    distance=4) equals sinuosity(E, N, 500, 4) for reaches longer than the
+    window.
+    """
+    East = np.asarray(Easting, dtype=float)
+    North = np.asarray(Northing, dtype=float)
+    n = len(East)
+    offsets = np.array([0, n] if offsets is None else offsets, dtype=np.intp)
+    reach = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    start, end = offsets[reach], offsets[reach + 1] - 1
+
+    if distance is not None:
+        if chainage is not None:
+            raise ValueError('give chainage or distance, not both')
+        # work in points, as sinuosity() does, and scale by distance at the end
+        s = (np.arange(n) - start).astype(float)
+        length = int(length / distance)
+    elif chainage is None:
+        step = np.hypot(np.diff(East), np.diff(North))
+        s = np.concatenate([[0], np.cumsum(step)])
+        s -= s[offsets[:-1]][reach]     # restart at each reach
+    else:
+        s = np.asarray(chainage, dtype=float)
+
+    # search every reach at once on keys that keep reaches apart; the reach
+    # spacing is a power of two so reach*spacing + s rounds the same way for
+    # data and search targets
+    span = np.ptp(s) + 2 * length + 1 if n else 1
+    spacing = 2.0 ** np.ceil(np.log2(span))
+    base = reach * spacing
+    key = base + s
+    lo = np.searchsorted(key, base + (s - length), side='left')
+    hi = np.searchsorted(key, base + (s + length), side='right') - 1
+    lo = np.clip(lo, start, end)
+    hi = np.clip(hi, start, end)
+    channel = s[hi] - s[lo]
+    if distance is not None:
+        # sinuosity()'s length for the last points of a reach is one point long
+        idx = np.arange(n)
+        channel = (channel + ((idx + length > end) & (idx - length >= start))) * distance
+    return channel / np.hypot(East[hi] - East[lo], North[hi] - North[lo])
+
 def Profile_smoothing(elevation, distance=None, plot=False):
     """Removes the 'bumps' present in an elevation profile caused by roads &
      imperfections in DEMs. Data must be arranged from highest elevation to lowest.
      
      Set plot=True and define distance to graph the resulting profile
     """
-    elevation = np.array(elevation)
-    output_elevation = np.zeros(len(elevation)); output_elevation[0]=elevation[0]
-    elevation[-1] = min(elevation)
-    i=1
-    while i < len(elevation):                    # loops through elevation dataset
-        if elevation[i] > elevation[i-1]:             # if the current value is greater than the previous,
-            j=i
-            while j < len(elevation)-1:          # loop through the remaining data...
-                j = j+1
-                if elevation[j] <= elevation[i-1]:    # to find the next point that is lower or equal to the last datum.
-                    for indx,k in enumerate(range(i, j)):       # changes the incorrect data...
-                        adj = np.linspace(elevation[i-1], elevation[j], num=len(elevation[i:j]), endpoint=False)   # to a linear interp.
-                        output_elevation[k] = adj[indx]
-                    break       # exits if statement
-            i=j-1               # starting point for the next iteration
-        else:
-            output_elevation[i] = elevation[i]   # if the elevation is less than or equal to the previous, that point kept
-        i = i+1                     # keeps the while loop interating to next datum
-        
+    output_elevation = smooth_profiles(elevation)
+
     if plot:
-            fig = plt.figure(figsize=(20,3))
-            ax1 = fig.add_subplot(111)
-            ax1.plot(distance, output_elevation, label='Elevation Profile')
-            ax1.invert_xaxis()
-            ax1.set_ylabel('Elevation')                    # y label
-            ax1.set_xlabel('Distance from mouth')          # x label
-            plt.title("Longitudinal Profile")       # title
-            plt.show()
+        from .plotting import plot_profile
+        plot_profile(distance, output_elevation)
 
     return output_elevation
 
-def IDW(x, y, z, xi, yi, power=1):
+@instrumented()
+def smooth_profiles(elevation, offsets=None):
+    """
+    Profile_smoothing for many profiles at once, in a single pass over a
+    concatenated buffer. Each profile must run from highest elevation to lowest.
+
+    elevation: elevations of all profiles, concatenated\n
+    offsets: start index of each profile plus the total number of points, e.g.
+    [0, 120, 450]; default is a single profile
+
+    A point is kept when it is at or below every point before it in its profile
+    (the last point is first lowered to the profile minimum). Points between
+    two kept points a and b are replaced by the line np.linspace(elevation[a],
+    elevation[b], b - a - 1, endpoint=False), exactly as Profile_smoothing does
+    one bump at a time. Returns the smoothed elevations as one flat array; the
+    input is not modified.
+    """
+    e = np.array(elevation, dtype=float)
+    n = len(e)
+    if n == 0:
+        return e
+    offsets = np.array([0, n] if offsets is None else offsets, dtype=np.intp)
+    # zero length profiles have no points; left in, reduceat and e[ends] would
+    # write into the profile before them
+    offsets = offsets[np.r_[True, np.diff(offsets) > 0]]
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    e[ends] = np.minimum.reduceat(e, starts)
+
+    # running minimum within each profile
+    if len(starts) == 1:
+        low = np.minimum.accumulate(e)
+    else:
+        # doubling scan that never reaches back past the start of a profile
+        pos = np.arange(n) - np.repeat(starts, np.diff(offsets))
+        low = e.copy()
+        k = 1
+        while k <= pos.max():
+            reach = pos[k:] >= k
+            low[k:][reach] = np.minimum(low[k:], low[:-k])[reach]
+            k *= 2
+    keep = e <= low
+
+    # nearest kept point before and after every point
+    idx = np.arange(n)
+    a = np.maximum.accumulate(np.where(keep, idx, 0))
+    b = np.minimum.accumulate(np.where(keep, idx, n)[::-1])[::-1]
+    out = e.copy()
+    bump = np.flatnonzero(~keep)
+    a, b = a[bump], b[bump]
+    # same arithmetic as np.linspace(e[a], e[b], num=b-a-1, endpoint=False)
+    out[bump] = (bump - a - 1) * ((e[b] - e[a]) / (b - a - 1)) + e[a]
+    return out
+
+@instrumented(arg=3)
+def IDW(x, y, z, xi, yi, power=1, k=None, radius=None, chunk=None):
     '''
     Inverse distance weighted interpolation
     
@@ -83,23 +217,116 @@ def IDW(x, y, z, xi, yi, power=1):
     xi and yi are the x and y grid over which to calculate IDW\n
     power is an int which is multiplied by the weight given to each grid point.
     A low power leads to a greater weight towards a grid point value of rainfall 
-    from remote rain gauges. 
+    from remote rain gauges.\n
+    k limits each grid point to its k nearest gauges (default all gauges)\n
+    radius ignores gauges farther than this from a grid point; grid points with
+    no gauge in range are NaN\n
+    chunk is the number of grid points evaluated at a time (default keeps
+    chunk * k near 4 million)
+
+    Gauges are found with a KD-tree and the grid is evaluated in chunks, so
+    memory does not grow with n_gauges * n_grid. A grid point on top of a gauge
+    takes that gauge's value. Returns an array shaped like xi.
     '''
-    xi, yi = xi.flatten(), yi.flatten()
-    dist = distance_matrix(x, y, xi, yi)
+    z = np.asarray(z, dtype=float).ravel()
+    zext = np.append(z, 0)      # index n marks a missing neighbour
+    zi = np.empty(np.size(xi))
+    for start, dist, idx in _neighbours(x, y, xi, yi, k, radius, chunk):
+        # In IDW, weights are 1 / distance
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / dist**power
+        # grid points on top of a gauge take the gauge value
+        hit = dist == 0
+        on_gauge = hit.any(axis=1)
+        weights[on_gauge] = hit[on_gauge]
+
+        # Make weights sum to one and multiply by the observed Z-values
+        with np.errstate(invalid='ignore'):
+            zi[start:start+len(dist)] = (weights * zext[idx]).sum(axis=1) / weights.sum(axis=1)
+    return zi.reshape(np.shape(xi))
+
+def _neighbours(x, y, xi, yi, k=None, radius=None, chunk=None):
+    """
+    Yields (start, dist, idx) for chunks of grid points: the distance to and
+    index of the k nearest gauges of each point, shaped (points, k). Missing
+    neighbours (outside radius) have an infinite distance and index len(x).
+    """
+    from scipy.spatial import cKDTree
+    n = len(np.ravel(x))
+    k = n if k is None else min(k, n)
+    if chunk is None:
+        chunk = max(2**22 // k, 1)
+    tree = cKDTree(np.column_stack((np.ravel(x), np.ravel(y))))
+    pts = np.column_stack((np.ravel(xi), np.ravel(yi)))
+    for start in range(0, len(pts), chunk):
+        dist, idx = tree.query(pts[start:start+chunk], k=k,
+                               distance_upper_bound=np.inf if radius is None else radius)
+        instrument.count('IDW neighbour queries', dist.size)
+        yield start, dist.reshape(len(dist), k), idx.reshape(len(idx), k)
+
+class IDWInterpolator(object):
+    # weight of a gauge under a grid point; swamps every other weight but still
+    # lets the others take over when that gauge is missing
+    _ON_GAUGE = 1e150
 
-    # In IDW, weights are 1 / distance
-    weights = 1.0 / (dist)**power
+    @instrumented(arg=3)
+    def __init__(self, x, y, xi, yi, power=1, k=None, radius=None, sparse=None, chunk=None):
+        """
+        Inverse distance weighted interpolation onto a fixed grid from fixed
+        gauges. The weight matrix (grid points x gauges) is computed once, and
+        each call interpolates a whole block of timesteps with one matrix product.
 
-    # Make weights sum to one
-    weights /= weights.sum(axis=0)
+        x, y: gauge locations\n
+        xi, yi: grid over which to calculate IDW\n
+        power, k, radius, chunk: as in IDW\n
+        sparse: store the weights as a scipy sparse matrix; the default is sparse
+        when k or radius limits the neighbours
+        """
+        n = len(np.ravel(x))
+        if sparse is None:
+            sparse = (k is not None and k < n) or radius is not None
+        self.shape = np.shape(xi)
+        self.n_gauges = n
+        rows, cols, vals = [], [], []
+        for start, dist, idx in _neighbours(x, y, xi, yi, k, radius, chunk):
+            with np.errstate(divide='ignore'):
+                weights = 1.0 / dist**power
+            weights[dist == 0] = self._ON_GAUGE
+            keep = idx < n
+            rows.append(np.nonzero(keep)[0] + start)
+            cols.append(idx[keep])
+            vals.append(weights[keep])
+        rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+        size = int(np.prod(self.shape))
+        if sparse:
+            from scipy.sparse import csr_matrix
+            self.weights = csr_matrix((vals, (rows, cols)), shape=(size, n))
+        else:
+            self.weights = np.zeros((size, n))
+            self.weights[rows, cols] = vals
+        self.total = np.asarray(self.weights.sum(axis=1)).ravel()
 
-    # Multiply the weights for each interpolated point by all observed Z-values
-    zi = np.dot(weights.T, z)
-    s = int(np.sqrt(len(zi)))
-    zi = zi.reshape((s, s))
-    return zi
+    @instrumented()
+    def __call__(self, z):
+        """
+        Interpolates gauge values z, shaped (gauges,) or (timesteps, gauges).
+        Missing (NaN) gauges are dropped for that timestep and the remaining
+        weights renormalized. Returns an array shaped like xi, with a leading
+        timestep axis for 2-D z.
+        """
+        z = np.asarray(z, dtype=float)
+        Z = np.atleast_2d(z)
+        valid = ~np.isnan(Z)
+        num = self.weights @ np.where(valid, Z, 0).T
+        if valid.all():
+            den = self.total[:, np.newaxis]
+        else:
+            den = self.weights @ valid.T.astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            zi = (np.asarray(num) / np.asarray(den)).T
+        return zi.reshape(z.shape[:-1] + self.shape)
 
+@instrumented()
 def distance_matrix(x0, y0, x1, y1):
     '''Distance matrix for IDW calculation'''
     obs = np.vstack((x0, y0)).T
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os, re, csv
+from functools import lru_cache
+import numpy as np, pandas as pd
+from .instrument import instrumented
+
+__all__ = ['MANNINGS_N_CSV', 'MANNING_K', 'mannings_table', 'mannings_n', 'manning_discharge',
+           'CrossSection']
+
+MANNINGS_N_CSV = os.path.join(os.path.dirname(__file__), 'ManningsN.csv')
+
+# Manning's constant for discharge in cfs from feet, or m3/s from meters
+MANNING_K = {'ft': 1.486, 'm': 1.0}
+
+def _rank(text):
+    """Nesting level of a table row from its numbering: 1. > a. > indented 1."""
+    if re.match(r'\d+\.', text):
+        return 1
+    if re.match(r'[a-z]\.', text):
+        return 2
+    if re.match(r'\s+\d+\.', text):
+        return 3
+    return None
+
+@lru_cache(maxsize=None)
+def mannings_table(path=MANNINGS_N_CSV):
+    """
+    Manning's n table (Chow, 1959 and AISI, 1980), parsed once and cached.
+
+    Returns a dataframe indexed by channel type, the full description path of
+    each entry with its section and headings joined by ' / ' (e.g. 'Natural
+    streams ... / 1. Main Channels / a. clean, straight, ...'), with columns
+    section, minimum, normal and maximum. Entries with a single n have it as
+    all three values.
+    """
+    rows, stack, section = [], [], None
+    with open(path, newline='') as fh:
+        for line in csv.reader(fh):
+            line = (line + ['', '', '', ''])[:4]
+            text = ' '.join(line[0].split())
+            if not text or line[1].strip() in ('Minimum', 'n'):
+                continue    # blank rows and column headers
+            values = [float(v) if v.strip() else np.nan for v in line[1:]]
+            rank = _rank(line[0])
+            if rank is None and all(np.isnan(values)):
+                section, stack = text, []
+                continue
+            if rank is not None:
+                stack = [(r, t) for r, t in stack if r < rank]
+            if all(np.isnan(values)):
+                stack.append((rank, text))
+                continue
+            if np.isnan(values[1:]).all():
+                values = [values[0]] * 3
+            rows.append([' / '.join([section] + [t for _, t in stack] + [text]), section] + values)
+    table = pd.DataFrame(rows, columns=['channel', 'section', 'minimum', 'normal', 'maximum'])
+    return table.set_index('channel')
+
+@lru_cache(maxsize=1024)
+def _match(channel):
+    table = mannings_table()
+    if channel in table.index:
+        return channel
+    found = [c for c in table.index if channel.lower() in c.lower()]
+    if len(found) != 1:
+        raise ValueError(f"{'no' if not found else len(found)} Manning's n entries match "
+                         f"'{channel}'" + ('' if not found else ': ' + '; '.join(found[:5])))
+    return found[0]
+
+def mannings_n(channel, value='normal'):
+    """
+    Manning's n of a channel type.
+
+    channel: a channel type from mannings_table, or a piece of one that matches
+    a single entry (case insensitive), e.g. 'concrete / 2. float finish'\n
+    value: 'minimum', 'normal' or 'maximum'
+    """
+    if value not in ('minimum', 'normal', 'maximum'):
+        raise ValueError("value must be 'minimum', 'normal' or 'maximum'")
+    return float(mannings_table().at[_match(channel), value])
+
+def manning_discharge(area, radius, slope, n, units='ft'):
+    """
+    Manning's equation, Q = k / n * A * R^(2/3) * S^(1/2), for arrays of area and
+    hydraulic radius.
+
+    units: 'ft' for cfs from square feet and feet, 'm' for m3/s from metres
+    """
+    if units not in MANNING_K:
+        raise ValueError(f'units must be one of {tuple(MANNING_K)}')
+    return MANNING_K[units] / n * np.asarray(area) * np.asarray(radius)**(2 / 3) * np.sqrt(slope)
+
+class CrossSection(object):
+    def __init__(self, station, elevation, n=None, slope=None, datum=None, units='ft'):
+        """
+        Surveyed channel cross section, for Manning discharge at an unrated site.
+
+        The hydraulic geometry is tabulated once at every surveyed elevation. Top
+        width and wetted perimeter are linear in stage between those elevations
+        and area is quadratic, so any stage is evaluated exactly from the table
+        without revisiting the survey. Water is assumed to fill everything below
+        the water surface between the two banks.
+
+        station: horizontal distance of each survey point across the channel\n
+        elevation: elevation of each survey point\n
+        n: Manning's n, or a channel type for mannings_n\n
+        slope: energy (water surface) slope\n
+        datum: elevation of stage 0, default the lowest point of the section\n
+        units: 'ft' or 'm'
+        """
+        x = np.asarray(station, dtype=float)
+        y = np.asarray(elevation, dtype=float)
+        if len(x) < 3 or len(x) != len(y):
+            raise ValueError('station and elevation must be the same length, at least 3 points')
+        self.station, self.elevation = x, y
+        self.n = mannings_n(n) if isinstance(n, str) else n
+        self.slope = slope
+        self.units = units
+        self.datum = y.min() if datum is None else datum
+        # stages above the lower bank would spill out of the section
+        self.max_stage = min(y[0], y[-1]) - self.datum
+
+        # segments between survey points, lowest and highest end
+        lo, hi = np.minimum(y[:-1], y[1:]), np.maximum(y[:-1], y[1:])
+        width, length = np.abs(np.diff(x)), np.hypot(np.diff(x), np.diff(y))
+        z = np.unique(y[y <= self.max_stage + self.datum])
+
+        def wet(strict):
+            # wetted share of each segment at each elevation; flat segments are
+            # dry at their own elevation when approached from below (strict)
+            depth = z[:, np.newaxis] - lo
+            rise = hi - lo
+            with np.errstate(invalid='ignore', divide='ignore'):
+                f = np.clip(depth / rise, 0, 1)
+            flat = rise == 0
+            f[:, flat] = (depth[:, flat] > 0) if strict else (depth[:, flat] >= 0)
+            return f @ width, f @ length
+
+        # left (below) and right (above) limits, which differ at flat segments
+        self._T0, self._P0 = wet(True)
+        self._T1, self._P1 = wet(False)
+        self._z = z
+        area = np.zeros(len(z))
+        area[1:] = np.cumsum((self._T1[:-1] + self._T0[1:]) / 2 * np.diff(z))
+        self._A = area
+        # a water surface exactly at a flat bench does not wet it
+        self.table = pd.DataFrame({
+            'stage': z - self.datum, 'area': area, 'wetted_perimeter': self._P0,
+            'hydraulic_radius': np.divide(area, self._P0, out=np.zeros(len(z)), where=self._P0 > 0),
+            'top_width': self._T0})
+
+    @instrumented()
+    def geometry(self, stage):
+        """
+        Area, wetted perimeter and hydraulic radius at each stage, from the
+        table. Stages below the section bottom are dry (zeros), stages above the
+        lower bank are NaN.
+        """
+        s = np.asarray(stage, dtype=float)
+        z = s + self.datum
+        zt = self._z
+        i = np.clip(np.searchsorted(zt, z) - 1, 0, max(len(zt) - 2, 0))
+        h = np.append(np.diff(zt), 1)[i]
+        dz = z - zt[i]
+        # top width and perimeter change linearly from the limit just above zt[i]
+        # to the limit just below zt[i+1]
+        dT = (np.append(self._T0[1:], self._T1[-1:]) - self._T1)[i] / h
+        dP = (np.append(self._P0[1:], self._P1[-1:]) - self._P1)[i] / h
+        area = self._A[i] + self._T1[i] * dz + dT * dz**2 / 2
+        perimeter = self._P1[i] + dP * dz
+        dry = z <= zt[0]
+        out = (s > self.max_stage) | np.isnan(s)
+        area, perimeter = np.where(dry, 0, area), np.where(dry, 0, perimeter)
+        area[out] = perimeter[out] = np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            radius = np.where(perimeter > 0, area / perimeter, 0)
+        radius[out] = np.nan
+        return area, perimeter, radius
+
+    @instrumented()
+    def discharge(self, stage, slope=None, n=None):
+        """
+        Manning discharge for a series of stages. slope and n default to the
+        section's; either may be an array matching stage.
+        """
+        slope = self.slope if slope is None else slope
+        n = self.n if n is None else n
+        if slope is None or n is None:
+            raise ValueError('slope and n are needed for Manning discharge')
+        area, _, radius = self.geometry(stage)
+        return manning_discharge(area, radius, slope, n, self.units)
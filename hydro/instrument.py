@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os, time, tracemalloc
+from collections import Counter
+from functools import wraps
+import numpy as np, pandas as pd
+
+class _State(object):
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.tracing = False    # tracemalloc was started by enable
+        self.records = []
+        self.counters = Counter()
+        self.hooks = []
+        self.stack = []         # [start, peak] traced bytes of the instrumented calls in progress
+
+_state = _State()
+
+def enable(memory=False):
+    """
+    Starts recording a timing record for every instrumented call in hydro.core
+    and hydro.geography.
+
+    memory: also record the peak memory allocated during each call. This runs
+    tracemalloc, which makes everything slower while enabled.
+    """
+    _state.enabled = True
+    _state.memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state.tracing = True
+
+def disable():
+    """Stops recording. Records and counters are kept until reset."""
+    _state.enabled = False
+    if _state.tracing:
+        tracemalloc.stop()
+    _state.memory = _state.tracing = False
+    _state.stack.clear()
+
+def reset():
+    """Clears the records and counters."""
+    _state.records.clear()
+    _state.counters.clear()
+
+class profile(object):
+    def __init__(self, memory=False):
+        """
+        Context manager that records only its block and leaves instrumentation as
+        it was:
+
+            with hydro.instrument.profile() as prof:
+                d.dailyQ()
+            print(prof.summary())
+        """
+        self.memory = memory
+
+    def __enter__(self):
+        self._was = (_state.enabled, _state.memory)
+        self._start = (len(_state.records), Counter(_state.counters))
+        enable(self.memory)
+        return self
+
+    def __exit__(self, *exc):
+        disable()
+        if self._was[0]:
+            enable(self._was[1])
+        self.records = _state.records[self._start[0]:]
+        self.counters = _state.counters - self._start[1]
+
+    def summary(self):
+        return summary(self.records)
+
+def add_hook(hook):
+    """Calls hook(record) after every instrumented call while enabled. Returns hook."""
+    _state.hooks.append(hook)
+    return hook
+
+def remove_hook(hook):
+    _state.hooks.remove(hook)
+
+def count(name, n=1):
+    """Adds n to the counter name, while enabled."""
+    if _state.enabled:
+        _state.counters[name] += n
+
+def counters():
+    """Dictionary of the counters."""
+    return dict(_state.counters)
+
+def records():
+    """
+    List of the records of instrumented calls, oldest first. Each is a dictionary
+    of name, start (epoch seconds), seconds, n (input size), peak_bytes (None
+    unless memory was recorded), pid and error (exception name or None).
+    """
+    return list(_state.records)
+
+def summary(recs=None):
+    """
+    Table of the records by function: number of calls, total, mean and max
+    seconds, total input size, samples per second and the largest peak memory in MB.
+    """
+    frame = pd.DataFrame(_state.records if recs is None else recs,
+                         columns=['name', 'start', 'seconds', 'n', 'peak_bytes', 'pid', 'error'])
+    frame['peak_bytes'] = frame.peak_bytes.astype(float)
+    table = frame.groupby('name', sort=False).agg(
+        calls=('seconds', 'size'), total_s=('seconds', 'sum'), mean_s=('seconds', 'mean'),
+        max_s=('seconds', 'max'), n=('n', 'sum'), peak_mb=('peak_bytes', 'max'))
+    table['per_s'] = table.n / table.total_s
+    table['peak_mb'] /= 2**20
+    return table.sort_values('total_s', ascending=False)
+
+def _size(args):
+    """
+    Input size of a call: the length of Q for Discharge objects, the number of
+    entries of a dictionary, else the size of the first array.
+    """
+    for a in args:
+        if isinstance(getattr(a, 'Q', None), np.ndarray):
+            return int(np.size(a.Q))
+        if isinstance(a, dict):
+            return len(a)
+        if isinstance(a, (np.ndarray, pd.Series, pd.DataFrame, list, tuple)):
+            return int(np.size(a))
+    return None
+
+def instrumented(name=None, arg=None):
+    """
+    Decorator that records a call of the function while instrumentation is
+    enabled. When disabled it costs one attribute check per call. Calls made in
+    worker processes are recorded in those processes, not the caller.
+
+    name: record name, defaults to the function's qualified name\n
+    arg: position of the argument whose size is the input size; by default the
+    first array (or Discharge) argument
+    """
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            memory = _state.memory and tracemalloc.is_tracing()
+            if memory:
+                # nested calls: fold the peak so far into the caller, then measure our own
+                current, peak = tracemalloc.get_traced_memory()
+                if _state.stack:
+                    _state.stack[-1][1] = max(_state.stack[-1][1], peak)
+                tracemalloc.reset_peak()
+                frame = [current, current]
+                _state.stack.append(frame)
+            error = None
+            start, t0 = time.time(), time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                seconds = time.perf_counter() - t0
+                peak = None
+                if memory:
+                    frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                    _state.stack.pop()
+                    if _state.stack:
+                        _state.stack[-1][1] = max(_state.stack[-1][1], frame[1])
+                    peak = frame[1] - frame[0]
+                record = {'name': label, 'start': start, 'seconds': seconds, 'n': _size(args if arg is None else args[arg:arg+1]),
+                          'peak_bytes': peak, 'pid': os.getpid(), 'error': error}
+                _state.records.append(record)
+                for hook in _state.hooks:
+                    hook(record)
+        return wrapper
+    return decorate
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import io, os, json, hashlib
+import numpy as np, pandas as pd
+from .core import Discharge
+
+__all__ = ['read_logger', 'load_discharge']
+
+_CHECK_BYTES = 256     # bytes before the ingested offset hashed to detect rewritten tails
+_HEAD_BYTES = 65536    # leading bytes (header and first rows) hashed to detect rewritten files
+
+def _hash(path, start, stop):
+    """Hash of the bytes start <= i < stop of a file."""
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        return hashlib.sha1(fh.read(max(stop - start, 0))).hexdigest()
+
+def _checks(path, offset):
+    """
+    Hashes of the leading bytes and of the bytes just before offset, used to
+    check that ingested rows are unchanged.
+    """
+    return [_hash(path, 0, min(offset, _HEAD_BYTES)),
+            _hash(path, max(offset - _CHECK_BYTES, 0), offset)]
+
+def _stat(st):
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def _stale(path, meta, st, time_col):
+    """True if the cache in meta does not hold a prefix of the csv as it is now."""
+    if meta is None or meta.get('time_col') != time_col or meta.get('stat') is None:
+        return True
+    size, mtime, inode = meta['stat']
+    if st.st_ino != inode or st.st_size < size or st.st_size < meta['offset']:
+        return True     # replaced or truncated
+    if st.st_size == size:
+        return st.st_mtime_ns != mtime      # unchanged, or rewritten in place
+    return _checks(path, meta['offset']) != meta['check']
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(cache_dir, meta):
+    tmp = os.path.join(cache_dir, 'meta.json.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(meta, fh)
+    os.replace(tmp, os.path.join(cache_dir, 'meta.json'))
+
+def _ingest(path, cache_dir, meta, time_col):
+    """
+    Parses the rows after meta['offset'] and writes them to the column files
+    after the meta['rows'] rows already there.
+    """
+    with open(path, 'rb') as fh:
+        fh.seek(meta['offset'])
+        data = fh.read()
+    # a logger may be part way through writing its last line, so a line without
+    # a newline is only taken once it has every column, and is parsed again
+    # when the file grows
+    end = data.rfind(b'\n') + 1
+    last = data[end:]
+    tail = None
+    if last.strip() and last.count(b',') >= len(meta['columns']) - 1:
+        tail = meta['offset'] + end
+    else:
+        data = data[:end]
+    if not data:
+        return meta
+    new = pd.read_csv(io.BytesIO(data), header=None, names=meta['columns'])
+    for col in meta['columns']:
+        if col == time_col:
+            values = pd.to_datetime(new[col]).values.astype('datetime64[ns]').view('int64')
+        else:
+            values = pd.to_numeric(new[col], errors='coerce').values.astype('float64')
+        # written in place rather than appended, so a row parsed again replaces
+        # the old one and the file never shrinks under existing memory maps
+        with open(os.path.join(cache_dir, col + '.bin'), 'r+b') as fh:
+            fh.seek(meta['rows'] * 8)
+            fh.write(np.ascontiguousarray(values).tobytes())
+    meta['rows'] += len(new)
+    meta['offset'] += len(data)
+    meta['tail'] = tail
+    meta['check'] = _checks(path, meta['offset'])
+    return meta
+
+def read_logger(path, cache_dir=None, time_col='TimeStamp'):
+    """
+    Reads a logger csv (TimeStamp, Level_ft, Rainfall_in, Temperature_F, ...)
+    through a columnar cache. The first read parses the csv into one binary file
+    per column (int64 nanoseconds since the epoch for the time column, float64
+    for the rest). Later reads memory map those files and only parse rows that
+    were appended to the csv since the last read. A last line without a newline
+    is read once it has every column, and read again if the file grows.
+
+    The cache is rebuilt if the csv is replaced, truncated or rewritten: its
+    size, modification time and inode and hashes of its first 64 KiB and of
+    the bytes just before the ingested offset are kept with the cache. An edit
+    elsewhere in a file that has also been appended to since the last read is
+    not detected.
+
+    path: logger csv file\n
+    cache_dir: cache directory, defaults to path + '.cache'\n
+    time_col: name of the timestamp column
+
+    Returns a dictionary of read-only memory mapped arrays keyed by column name;
+    the time column is a datetime64[ns] view of the cached integers.
+    """
+    if cache_dir is None:
+        cache_dir = path + '.cache'
+    os.makedirs(cache_dir, exist_ok=True)
+    st = os.stat(path)
+    meta = _read_meta(cache_dir)
+    if _stale(path, meta, st, time_col):
+        with open(path, 'rb') as fh:
+            header = fh.readline()
+        columns = [c.strip() for c in header.decode().split(',')]
+        if time_col not in columns:
+            raise ValueError(f'{path} has no {time_col} column')
+        for col in columns:
+            open(os.path.join(cache_dir, col + '.bin'), 'wb').close()
+        meta = {'columns': columns, 'time_col': time_col, 'rows': 0,
+                'offset': len(header), 'tail': None, 'check': None, 'stat': None}
+    if _stat(st) != meta['stat']:
+        if meta['tail'] is not None and st.st_size > meta['offset']:
+            # the unterminated last row read before may have been finished since
+            meta['rows'] -= 1
+            meta['offset'], meta['tail'] = meta['tail'], None
+        meta = _ingest(path, cache_dir, meta, time_col)
+        meta['stat'] = _stat(st)
+        _write_meta(cache_dir, meta)
+
+    data = {}
+    for col in meta['columns']:
+        dtype = 'int64' if col == time_col else 'float64'
+        if meta['rows'] == 0:
+            values = np.zeros(0, dtype=dtype)
+        else:
+            values = np.memmap(os.path.join(cache_dir, col + '.bin'), dtype=dtype,
+                               mode='r', shape=(meta['rows'],))
+        data[col] = values.view('datetime64[ns]') if col == time_col else values
+    return data
+
+def load_discharge(path, rc=None, Q='Level_ft', rain='Rainfall_in', cache_dir=None,
+                   time_col='TimeStamp'):
+    """
+    Builds a Discharge object from a logger csv read through read_logger. Time,
+    rain and (without a rating curve) discharge are the memory mapped arrays
+    themselves, not copies.
+
+    path: logger csv file\n
+    rc: optional RC used to convert the stage column to discharge\n
+    Q: column holding discharge, or stage when rc is given\n
+    rain: rainfall column, or None\n
+    cache_dir: cache directory, defaults to path + '.cache'
+    """
+    data = read_logger(path, cache_dir, time_col)
+    flow = data[Q] if rc is None else rc.convert(data[Q])
+    return Discharge(data[time_col], flow, data[rain] if rain else None)
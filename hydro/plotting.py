@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np, matplotlib.pyplot as plt
+from matplotlib.ticker import FuncFormatter
+from .core import exp_curve
+from .resample import decimate
+
+# the seaborn styles were renamed in matplotlib 3.6
+STYLE = next((s for s in ('seaborn-v0_8-ticks', 'seaborn-ticks') if s in plt.style.available),
+             'default')
+
+# tick labels with as many decimals as the order of magnitude needs
+log_formatter = FuncFormatter(lambda y,pos: ('{{:.{:1d}f}}'.format(int(np.maximum(-np.log10(y),0)))).format(y))
+
+def plot_rating_curve(rc, title='Rating Curve', log=True):
+    """ plot the rating curve """
+    with plt.style.context(STYLE):
+        fig = plt.figure()
+        ax1 = fig.add_subplot(111, facecolor=[.95,.95,.95])
+        plt.grid(True, which='both', color='w', ls='-', zorder=0)
+        ax1.scatter(rc.stage, rc.discharge, color='k', s=10)
+        ax1.set_ylabel(r'Discharge, cfs')
+        ax1.set_xlabel(r'Stage, ft')
+        if log:
+            ax1.set_ylim(0.01, 100)
+            ax1.set_yscale('log'); ax1.set_xscale('log')                              # log scale x and y
+            ax1.yaxis.set_major_formatter(log_formatter)
+            ax1.xaxis.set_major_formatter(log_formatter)
+        plt.title(title)
+        ax1.set_axisbelow(True)         # puts grid below plot
+
+        # write the equation in the plot
+        ax1.text(0.05, 0.7, f'y = {rc.popt[0]:.3f}x^{rc.popt[1]:.3f}',
+                 fontsize=15, transform=ax1.transAxes)
+        # draw the model line
+        line = np.linspace(min(rc.stage), max(rc.stage), 100)
+        ax1.plot(line, exp_curve(line, rc.popt[0], rc.popt[1]), color='k')
+    plt.show()
+
+def plot_flow_duration(fd):
+    """ plot a flow duration curve returned by Discharge.flow_duration """
+    import probscale # flow duration curves use a probability scale for the x axis
+    with plt.style.context(STYLE):
+        fig = plt.figure(figsize=[8, 10])
+        ax1 = fig.add_subplot(111, facecolor=[.95,.95,.95])
+        plt.grid(True, which='both', color='w', ls='-', zorder=0)
+        ax1.plot(fd['exeedance_prob'], fd['discharge_cfs'], 'x', ls='',
+                 color='k', label='Total Flow', ms=5)
+
+        # set y axis to log scale and x axis to probability scale
+        ax1.set_yscale('log')
+        ax1.set_xscale('prob') # from import probscale
+        plt.xticks([.01,.1,.5,1,2,5,10,20,30,40,50,60,70,80,90,95,98,99,99.5,99.9,99.99],
+                   rotation='vertical')
+        plt.legend()
+        plt.title('Flow Duration Curve')
+        plt.ylabel('Flow (cfs)')
+        plt.xlabel('Percentage of time flow was equaled or exceeded')
+    plt.show()
+
+def plot_discharge(d, addseries=[], log=True, title='Discharge', full=False):
+    """
+    Quick plot with or without rain data.\n
+    If you wish to plot more than one series to compare them, use addseries
+    to list in order of [time, Q, ...] for each additional series.\n
+    Each series is decimated to the lowest and highest point per pixel column
+    of the figure; set full=True to draw every point.
+    """
+    with plt.style.context(STYLE):
+        fig = plt.figure()
+        n_out = np.inf if full else 2 * int(fig.get_figwidth() * fig.dpi)
+        thin = lambda x, y: (x, y) if full else decimate(x, y, n_out)
+        ax1 = fig.add_subplot(111, facecolor=[.95,.95,.95])
+        plt.grid(True, which='both', color='w', ls='-', zorder=0)
+        ax1.plot(*thin(d.time, d.Q), label='Series1')
+        if len(d.rain) != 0:
+            ax2 = ax1.twinx()
+            ax2.plot(*thin(d.time, d.rain), alpha=.5, c='b', lw=1, label='Rain')
+            ax2.set_ylim(1, 0)
+            ax2.set_ylabel(r'Rain, in')
+        ax1.set_ylabel('Discharge, cfs')
+        ax1.set_xlabel('Stage, ft')
+        # log scale for y axis
+        if log:
+            ax1.set_yscale('log')
+            ax1.yaxis.set_major_formatter(log_formatter)
+        # add ablity to plot multiple time series
+        more = len(addseries)
+        while more > 0:
+            ax1.plot(*thin(addseries[more-2], addseries[more-1]),
+                     label=f'Series{int(len(addseries)/2-more/2 +2)}')
+            more -= 2
+        ax1.legend(loc='best')
+        plt.title(title)
+    plt.show()
+
+def plot_profile(distance, elevation):
+    """ plot a longitudinal profile """
+    with plt.style.context(STYLE):
+        fig = plt.figure(figsize=(20,3))
+        ax1 = fig.add_subplot(111)
+        ax1.plot(distance, elevation, label='Elevation Profile')
+        ax1.invert_xaxis()
+        ax1.set_ylabel('Elevation')                    # y label
+        ax1.set_xlabel('Distance from mouth')          # x label
+        plt.title("Longitudinal Profile")       # title
+    plt.show()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np, pandas as pd
+
+# resample is left out so that hydro.resample stays this module; it is
+# hydro.resample.resample, or Discharge.resample
+__all__ = ['FREQS', 'METHODS', 'as_datetime64', 'floor_time', 'Aggregates', 'AggregatePyramid',
+           'decimate']
+
+FREQS = ('hour', 'day', 'month', 'wateryear')
+METHODS = ('mean', 'sum', 'min', 'max', 'count')
+_UNITS = {'hour': 'h', 'day': 'D', 'month': 'M'}
+
+def as_datetime64(time):
+    """
+    Time as a datetime64[ns] array. Timezone aware pandas times are converted
+    to their local wall time. Arrays that are already datetime64[ns] are not copied.
+    """
+    if isinstance(time, (pd.Series, pd.Index)) and getattr(time.dtype, 'tz', None) is not None:
+        time = pd.DatetimeIndex(time).tz_localize(None)
+    return np.asarray(time, dtype='datetime64[ns]')
+
+def floor_time(time, freq):
+    """
+    Floors datetime64 times to the start of their hour, day, month or water year
+    (October 1 to September 30).
+    """
+    t = as_datetime64(time)
+    if freq == 'wateryear':
+        # shift October forward into the next calendar year, floor, then shift back
+        months = t.astype('datetime64[M]') + 3
+        return (months.astype('datetime64[Y]').astype('datetime64[M]') - 3).astype('datetime64[ns]')
+    if freq not in _UNITS:
+        raise ValueError(f'freq must be one of {FREQS}')
+    return t.astype(f'datetime64[{_UNITS[freq]}]').astype('datetime64[ns]')
+
+def _segments(keys):
+    """Start index of each run of equal keys in a sorted array."""
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.intp)
+    return np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+
+def _reduce(starts, total, count, low, high):
+    """Combines partial sums, counts, minimums and maximums over each segment."""
+    return (np.add.reduceat(total, starts, axis=0), np.add.reduceat(count, starts, axis=0),
+            np.fmin.reduceat(low, starts, axis=0), np.fmax.reduceat(high, starts, axis=0))
+
+class Aggregates(object):
+    def __init__(self, bins, total, count, low, high):
+        """
+        Sum, count, minimum and maximum of the values in each time bin, ignoring NaNs.
+
+        bins: datetime64 start of each bin
+        """
+        self.bins = bins
+        self.total = total
+        self.count = count
+        self.low = low
+        self.high = high
+
+    def get(self, method='mean'):
+        """Aggregated values for method 'mean', 'sum', 'min', 'max' or 'count'."""
+        if method == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return self.total / self.count
+        elif method == 'sum':
+            return self.total
+        elif method == 'min':
+            return self.low
+        elif method == 'max':
+            return self.high
+        elif method == 'count':
+            return self.count.astype(np.int64)
+        raise ValueError(f'method must be one of {METHODS}')
+
+    def coarsen(self, freq):
+        """Aggregates of a coarser frequency built from these bins."""
+        keys = floor_time(self.bins, freq)
+        if len(keys) == 0:
+            return Aggregates(keys, self.total, self.count, self.low, self.high)
+        starts = _segments(keys)
+        return Aggregates(keys[starts], *_reduce(starts, self.total, self.count, self.low, self.high))
+
+    @classmethod
+    def from_series(cls, time, Q, freq='hour'):
+        """Aggregates a series (time along the first axis of Q) into bins of freq."""
+        keys = floor_time(time, freq)
+        Q = np.asarray(Q, dtype=float)
+        if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+            order = np.argsort(keys, kind='stable')
+            keys, Q = keys[order], Q[order]
+        if len(keys) == 0:
+            empty = np.zeros((0,) + Q.shape[1:])
+            return cls(keys, empty, empty, empty, empty)
+        valid = ~np.isnan(Q)
+        starts = _segments(keys)
+        return cls(keys[starts], *_reduce(starts, np.where(valid, Q, 0), valid.astype(float),
+                                          Q, Q))
+
+class AggregatePyramid(object):
+    def __init__(self, time, Q):
+        """
+        Hourly, daily, monthly and water year aggregates of a series. The raw series
+        is only scanned once, for the hourly level; every coarser level is built from
+        the level below it.
+
+        time: timeseries\n
+        Q: values, time along the first axis
+        """
+        self.levels = {'hour': Aggregates.from_series(time, Q, 'hour')}
+        for finer, freq in zip(FREQS[:-1], FREQS[1:]):
+            self.levels[freq] = self.levels[finer].coarsen(freq)
+
+    def get(self, freq='day', method='mean'):
+        """Returns the bin start times and aggregated values of a level."""
+        if freq not in self.levels:
+            raise ValueError(f'freq must be one of {FREQS}')
+        level = self.levels[freq]
+        return level.bins, level.get(method)
+
+def resample(time, Q, freq='day', method='mean'):
+    """
+    Aggregates a series into hourly, daily, monthly or water year bins.
+
+    time: timeseries\n
+    Q: values, time along the first axis\n
+    freq: 'hour', 'day', 'month' or 'wateryear'\n
+    method: 'mean', 'sum', 'min', 'max' or 'count'
+
+    Returns the bin start times and aggregated values.
+    """
+    level = Aggregates.from_series(time, Q, freq)
+    return level.bins, level.get(method)
+
+def decimate(x, y, n_out):
+    """
+    Min/max decimation for plotting long series. The series is split into
+    n_out // 2 buckets of equal length and only the lowest and highest point
+    of each bucket are kept, in their original order, so storm peaks and
+    troughs survive at any zoom level. Series of n_out points or fewer are
+    returned unchanged.
+
+    x: x values (e.g. times)\n
+    y: values to decimate, NaNs are never chosen unless a bucket is all NaN\n
+    n_out: maximum number of points to keep, e.g. twice the plot width in pixels
+
+    Returns the kept x and y.
+    """
+    x, y = np.asarray(x), np.asarray(y, dtype=float)
+    n = len(y)
+    buckets = max(n_out // 2, 1)
+    if n <= n_out or n <= 2:
+        return x, y
+    size = -(-n // buckets)
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    missing = np.isnan(padded)
+    offset = np.arange(buckets) * size
+    low = np.argmin(np.where(missing, np.inf, padded), axis=1) + offset
+    high = np.argmax(np.where(missing, -np.inf, padded), axis=1) + offset
+    idx = np.unique(np.concatenate([low, high]))
+    idx = idx[idx < n]
+    return x[idx], y[idx]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np, pandas as pd
+
+__all__ = ['FlowDurationSketch']
+
+class FlowDurationSketch(object):
+    def __init__(self, eps=.01, seed=None):
+        """
+        Mergeable quantile sketch (KLL style) for approximate flow duration curves.
+
+        Values are kept in compactors; level h holds items of weight 2**h. When a
+        level outgrows its capacity it is sorted and every other item is promoted
+        to the level above, so memory stays at a few times 1/eps items no matter
+        how many values are added. A compaction moves the rank of any value by 0
+        or +/- the weight of the compacted level with a random sign, so the errors
+        mostly cancel; rank_error tracks a three standard deviation bound.
+
+        eps: target rank error as a fraction of the number of values\n
+        seed: seed for the random choice of which half of a level is promoted
+        """
+        self.eps = eps
+        self.k = max(int(np.ceil(4 / eps)), 8)
+        self.n = 0
+        self.levels = [np.zeros(0)]
+        self._var = 0.0         # variance of the rank error from all compactions
+        self._rng = np.random.default_rng(seed)
+        self._sorted = None
+
+    def _capacity(self, h):
+        # lower levels get geometrically smaller buffers, as in KLL
+        return max(int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - h))), 2)
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) >= self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                items = np.sort(items)
+                # an odd item out stays behind at this level
+                keep, items = items[:len(items) % 2], items[len(items) % 2:]
+                promote = items[self._rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promote])
+                self._var += 4.0 ** h
+            h += 1
+        self._sorted = None
+
+    def update(self, Q):
+        """Adds discharge values to the sketch. NaNs are ignored."""
+        Q = np.asarray(Q, dtype=float).ravel()
+        Q = Q[~np.isnan(Q)]
+        self.levels[0] = np.concatenate([self.levels[0], Q])
+        self.n += len(Q)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Adds the values summarized by another sketch, e.g. another year or gauge."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._var += other._var
+        self._compress()
+        return self
+
+    @property
+    def rank_error(self):
+        """Rank error of a query (three standard deviations), as a fraction of n."""
+        return 3 * np.sqrt(self._var) / self.n if self.n else 0.0
+
+    def _cdf(self):
+        """Retained values in increasing order and the total weight up to each."""
+        if self._sorted is None:
+            values = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(items), 2.0 ** h)
+                                      for h, items in enumerate(self.levels)])
+            order = np.argsort(values, kind='stable')
+            self._sorted = values[order], np.cumsum(weights[order])
+        return self._sorted
+
+    def exceedance(self, Q):
+        """Percentage of time each discharge in Q was exceeded; NaN for an empty sketch."""
+        values, cum = self._cdf()
+        Q = np.asarray(Q, dtype=float)
+        if len(values) == 0:
+            return np.full_like(Q, np.nan)[()]
+        idx = np.searchsorted(values, Q, side='right')
+        below = np.where(idx > 0, cum[np.maximum(idx - 1, 0)], 0)
+        return 100 - below / cum[-1] * 100
+
+    def discharge(self, prob):
+        """Discharge equaled or exceeded prob percent of the time; NaN for an empty sketch."""
+        values, cum = self._cdf()
+        prob = np.asarray(prob, dtype=float)
+        if len(values) == 0:
+            return np.full_like(prob, np.nan)[()]
+        target = (100 - prob) / 100 * cum[-1]
+        idx = np.searchsorted(cum, target, side='left')
+        return values[np.clip(idx, 0, len(values) - 1)]
+
+    def flow_duration(self):
+        """
+        Approximate flow duration curve in the layout of Discharge.flow_duration:
+        the retained discharge values in increasing order and their exceedance probability.
+        """
+        values, cum = self._cdf()
+        last = np.ones(len(values), dtype=bool)
+        last[:-1] = values[1:] != values[:-1]
+        # an empty sketch gives an empty curve, as the exact curve of an empty record
+        total = cum[-1] if len(cum) else 1.0
+        return pd.DataFrame({'discharge_cfs': values[last],
+                             'exeedance_prob': 100 - cum[last] / total * 100})
@@ -8,4 +8,5 @@ setup(name='hydro',
       author_email='capruitt09@gmail.com',
       license='MIT License',
       packages=['hydro'],
+      package_data={'hydro': ['ManningsN.csv']},
       zip_safe=False)